@@ -1,19 +1,26 @@
 from pathlib import Path
+import subprocess
+import sys
 
 from hat.doit import common
+from hat.doit.benchmark import get_task_benchmark
 from hat.doit.py import (get_task_build_wheel,
                          get_task_create_pip_requirements,
+                         get_task_run_pytest,
                          run_flake8)
 
 
 __all__ = ['task_clean_all',
            'task_build',
            'task_check',
-           'task_pip_requirements']
+           'task_test',
+           'task_pip_requirements',
+           'task_benchmark']
 
 
 build_dir = Path('build')
 src_py_dir = Path('src_py')
+pytest_dir = Path('test_pytest')
 
 
 def task_clean_all():
@@ -29,9 +36,65 @@ def task_build():
 
 def task_check():
     """Check"""
-    return {'actions': [(run_flake8, [src_py_dir])]}
+    return {'actions': [(run_flake8, [src_py_dir]),
+                        (run_flake8, [pytest_dir]),
+                        _check_import_time]}
+
+
+def task_test():
+    """Test"""
+    return get_task_run_pytest([str(pytest_dir)])
 
 
 def task_pip_requirements():
     """Create pip requirements"""
     return get_task_create_pip_requirements()
+
+
+def task_benchmark():
+    """Run benchmarks"""
+    return get_task_benchmark(build_dir=build_dir / 'benchmark',
+                              results_path=build_dir / 'benchmark.json')
+
+
+def _check_import_time():
+    modules = ['hat.doit.c',
+               'hat.doit.common',
+               'hat.doit.docs',
+               'hat.doit.js',
+               'hat.doit.py']
+    lazy_modules = {'doit',
+                    'http.server',
+                    'mkwhl',
+                    'multiprocessing',
+                    'packaging',
+                    'socketserver',
+                    'sphinx',
+                    'watchdog'}
+
+    result = subprocess.run([sys.executable, '-X', 'importtime',
+                             '-c', f"import {', '.join(modules)}"],
+                            stderr=subprocess.PIPE,
+                            text=True,
+                            check=True)
+
+    imported = {}
+    for line in result.stderr.split('\n'):
+        if not line.startswith('import time:'):
+            continue
+
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue
+
+        imported[name.strip()] = int(cumulative)
+
+    for module in modules:
+        print(f'{module}: {imported[module] / 1000:.1f} ms')
+
+    eager_modules = {name for name in imported
+                     if name.split('.')[0] in lazy_modules or
+                     name in lazy_modules}
+    if eager_modules:
+        print(f"eagerly imported: {', '.join(sorted(eager_modules))}")
+        return False
@@ -0,0 +1,356 @@
+from collections.abc import Iterable
+from pathlib import Path
+import enum
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import common
+
+
+class Scenario(enum.Enum):
+    C = 'c'
+    PY = 'py'
+    COPY = 'copy'
+
+
+class Measurement(enum.Enum):
+    GENERATE = 'generate'
+    NOOP = 'noop'
+    INCREMENTAL = 'incremental'
+    MEMORY = 'memory'
+
+
+def create_c_project(path: Path,
+                     src_count: int = 1000,
+                     header_count: int = 200,
+                     include_count: int = 10):
+    rand = random.Random(0)
+
+    src_dir = path / 'src'
+    inc_dir = path / 'inc'
+    src_dir.mkdir(parents=True, exist_ok=True)
+    inc_dir.mkdir(parents=True, exist_ok=True)
+
+    for i in range(header_count):
+        includes = rand.sample(range(header_count), min(3, header_count))
+        _write_lines(inc_dir / f'h{i}.h',
+                     f'#ifndef H{i}_H',
+                     f'#define H{i}_H',
+                     *(f'#include "h{j}.h"' for j in includes if j != i),
+                     '#include <stddef.h>',
+                     f'int h{i}(int x);',
+                     '#endif')
+
+    for i in range(src_count):
+        includes = rand.sample(range(header_count),
+                               min(include_count, header_count))
+        _write_lines(src_dir / f's{i}.c',
+                     *(f'#include <h{j}.h>' for j in includes),
+                     f'int s{i}(int x) {{ return x + {i}; }}')
+
+    _write_lines(src_dir / 'main.c',
+                 'int main(void) { return 0; }')
+
+    _write_dodo(path, ['deps', 'objs', 'exe'],
+                'from hat.doit.c import CBuild',
+                "build = CBuild(sorted(Path('src').glob('*.c')),",
+                "               Path('build'),",
+                "               src_dir=Path('src'),",
+                "               c_flags=['-Iinc'])",
+                'def task_deps():',
+                '    yield from build.get_task_deps()',
+                'def task_objs():',
+                '    yield from build.get_task_objs()',
+                'def task_exe():',
+                "    yield from build.get_task_exe(Path('build/main'))")
+
+    return src_dir / 's0.c'
+
+
+def create_py_project(path: Path,
+                      depth: int = 6,
+                      width: int = 3,
+                      file_count: int = 10):
+    src_dir = path / 'src_py'
+    dir_paths = [src_dir / 'bench']
+
+    for _ in range(depth):
+        dir_paths = [dir_path / f'd{i}'
+                     for dir_path in dir_paths
+                     for i in range(width)]
+
+    for dir_path in dir_paths:
+        dir_path.mkdir(parents=True, exist_ok=True)
+
+        for package_path in (dir_path, *dir_path.parents):
+            if package_path == src_dir:
+                break
+
+            (package_path / '__init__.py').touch()
+
+        for i in range(file_count):
+            _write_lines(dir_path / f'm{i}.py',
+                         f'def f{i}(x):',
+                         f'    return x + {i}')
+
+    _write_lines(path / 'pyproject.toml',
+                 '[project]',
+                 'name = "bench"',
+                 'version = "0.0.1"')
+
+    _write_dodo(path, ['wheel'],
+                'from hat.doit.py import get_task_build_wheel',
+                "src_dir = Path('src_py')",
+                'def task_wheel():',
+                '    file_dep = list(common.path_rglob(',
+                "        src_dir, blacklist={'__pycache__'}))",
+                '    return get_task_build_wheel(src_dir=src_dir,',
+                "                                build_dir=Path('build'),",
+                '                                file_dep=file_dep)')
+
+    return dir_paths[-1] / 'm0.py'
+
+
+def create_copy_project(path: Path,
+                        dir_count: int = 100,
+                        file_count: int = 100,
+                        file_size: int = 1024):
+    rand = random.Random(0)
+    src_dir = path / 'src'
+
+    for i in range(dir_count):
+        dir_path = src_dir / f'd{i}'
+        dir_path.mkdir(parents=True, exist_ok=True)
+
+        for j in range(file_count):
+            (dir_path / f'f{j}').write_bytes(rand.randbytes(file_size))
+
+    _write_dodo(path, ['copy'],
+                'def task_copy():',
+                "    return common.get_task_copy([(Path('src'),",
+                "                                  Path('build/dst'))])")
+
+    return src_dir / 'd0' / 'f0'
+
+
+def run_benchmark(scenario: Scenario,
+                  path: Path,
+                  *,
+                  scale: float = 1,
+                  repeat: int = 3
+                  ) -> dict[Measurement, float]:
+    common.rm_rf(path)
+    path.mkdir(parents=True)
+
+    if scenario == Scenario.C:
+        changed_path = create_c_project(path,
+                                        src_count=max(int(1000 * scale), 1),
+                                        header_count=max(int(200 * scale), 1))
+
+    elif scenario == Scenario.PY:
+        changed_path = create_py_project(path,
+                                         file_count=max(int(10 * scale), 1))
+
+    elif scenario == Scenario.COPY:
+        changed_path = create_copy_project(path,
+                                           dir_count=max(int(100 * scale), 1))
+
+    else:
+        raise ValueError('unsupported scenario')
+
+    # benchmarked projects use this hat-doit implementation
+    python_paths = [str(Path(__file__).parents[2]),
+                    *os.environ.get('PYTHONPATH', '').split(os.pathsep)]
+    env = {**os.environ,
+           'PYTHONPATH': os.pathsep.join(i for i in python_paths if i)}
+
+    results = {Measurement.GENERATE: [],
+               Measurement.NOOP: [],
+               Measurement.INCREMENTAL: [],
+               Measurement.MEMORY: []}
+
+    _run_doit(path, env, 'run')
+
+    for i in range(repeat):
+        duration, memory = _run_doit(path, env, 'list', '--all')
+        results[Measurement.GENERATE].append(duration)
+        if memory is not None:
+            results[Measurement.MEMORY].append(memory)
+
+        duration, memory = _run_doit(path, env, 'run')
+        results[Measurement.NOOP].append(duration)
+        if memory is not None:
+            results[Measurement.MEMORY].append(memory)
+
+        with open(changed_path, 'a') as f:
+            f.write(f'\n# {i}\n' if changed_path.suffix == '.py' else
+                    f'\n/* {i} */\n' if changed_path.suffix else
+                    f'{i}')
+
+        duration, memory = _run_doit(path, env, 'run')
+        results[Measurement.INCREMENTAL].append(duration)
+        if memory is not None:
+            results[Measurement.MEMORY].append(memory)
+
+    # memory is not measured on platforms without wait4
+    return {measurement: (max(values) if measurement == Measurement.MEMORY
+                          else min(values))
+            for measurement, values in results.items()
+            if values}
+
+
+def run_benchmarks(build_dir: Path,
+                   results_path: Path,
+                   *,
+                   version: str | None = None,
+                   scenarios: Iterable[Scenario] = Scenario,
+                   scale: float = 1,
+                   repeat: int = 3):
+    version = version or common.get_version()
+
+    results = (json.loads(results_path.read_text())
+               if results_path.exists() else {})
+    previous_version = next((i for i in reversed(results) if i != version),
+                            None)
+
+    version_results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': scale,
+        'scenarios': {}}
+
+    for scenario in scenarios:
+        if scenario == Scenario.C and not shutil.which('cc'):
+            print(f'{scenario.value}: skipped (cc not available)')
+            continue
+
+        print(f'{scenario.value}: running...')
+        scenario_results = run_benchmark(scenario, build_dir / scenario.value,
+                                         scale=scale,
+                                         repeat=repeat)
+        version_results['scenarios'][scenario.value] = {
+            measurement.value: value
+            for measurement, value in scenario_results.items()}
+
+    results.pop(version, None)
+    results[version] = version_results
+
+    results_path.parent.mkdir(parents=True, exist_ok=True)
+    results_path.write_text(json.dumps(results, indent=2))
+
+    _print_results(version, version_results,
+                   previous_version,
+                   results.get(previous_version))
+
+
+def get_task_benchmark(build_dir: Path = Path('build/benchmark'),
+                       results_path: Path = Path('build/benchmark.json'),
+                       *,
+                       version: str | None = None,
+                       scenarios: Iterable[Scenario] = Scenario,
+                       scale: float = 1,
+                       repeat: int = 3,
+                       task_dep=[]
+                       ) -> dict:
+    scenarios = list(scenarios)
+
+    def action(scale):
+        run_benchmarks(build_dir, results_path,
+                       version=version,
+                       scenarios=scenarios,
+                       scale=scale,
+                       repeat=repeat)
+
+    return {'actions': [action],
+            'params': [{'name': 'scale',
+                        'long': 'scale',
+                        'type': float,
+                        'default': scale}],
+            'task_dep': task_dep,
+            'uptodate': [False]}
+
+
+def _run_doit(path, env, *args):
+    with tempfile.TemporaryFile() as stderr:
+        start = time.monotonic()
+        p = subprocess.Popen([sys.executable, '-m', 'doit', *args],
+                             cwd=path,
+                             env=env,
+                             stdin=subprocess.DEVNULL,
+                             stdout=subprocess.DEVNULL,
+                             stderr=stderr)
+
+        # rusage of waited process contains its peak memory usage
+        if hasattr(os, 'wait4'):
+            _, status, rusage = os.wait4(p.pid, 0)
+            duration = time.monotonic() - start
+            p.returncode = os.waitstatus_to_exitcode(status)
+
+        else:
+            p.wait()
+            duration = time.monotonic() - start
+            rusage = None
+
+        if p.returncode:
+            stderr.seek(0)
+            sys.stderr.write(stderr.read().decode(errors='replace'))
+            raise subprocess.CalledProcessError(p.returncode, p.args)
+
+    if rusage is None:
+        return duration, None
+
+    # ru_maxrss is in kilobytes on linux and in bytes on darwin
+    memory = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return duration, memory
+
+
+def _print_results(version, results, previous_version, previous_results):
+    print(f'hat-doit {version} (python {results["python"]}, '
+          f'scale {results["scale"]})')
+    if previous_results:
+        print(f'compared to {previous_version}')
+
+    for scenario, scenario_results in results['scenarios'].items():
+        for measurement in Measurement:
+            value = scenario_results.get(measurement.value)
+            if value is None:
+                continue
+
+            line = (f'  {scenario:<6}{measurement.value:<13}'
+                    f'{_format_value(measurement, value):>12}')
+
+            previous_value = (
+                previous_results['scenarios'].get(scenario, {}).get(
+                    measurement.value)
+                if previous_results and
+                previous_results['scale'] == results['scale'] else None)
+            if previous_value:
+                line += f'{(value / previous_value - 1):>+10.1%}'
+
+            print(line)
+
+
+def _format_value(measurement, value):
+    if measurement == Measurement.MEMORY:
+        return f'{value / 2**20:.1f} MiB'
+
+    return f'{value * 1e3:.0f} ms'
+
+
+def _write_dodo(path, default_tasks, *lines):
+    _write_lines(path / 'dodo.py',
+                 'from pathlib import Path',
+                 'from hat.doit import common',
+                 f'DOIT_CONFIG = common.init(default_tasks={default_tasks!r})',
+                 *lines)
+
+
+def _write_lines(path, *lines):
+    path.write_text(''.join(f'{line}\n' for line in lines))
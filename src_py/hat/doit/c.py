@@ -1,8 +1,9 @@
 from pathlib import Path
-from typing import Iterable
+from typing import TYPE_CHECKING, Iterable
 import functools
 import importlib.resources
 import os
+import re
 import shlex
 import shutil
 import subprocess
@@ -11,6 +12,9 @@ import sysconfig
 from . import clang as hat_doit_clang
 from . import common
 
+if TYPE_CHECKING:
+    from . import ccserver
+
 
 def get_exe_suffix(platform: common.Platform = common.target_platform
                    ) -> str:
@@ -141,6 +145,36 @@ def get_cc(platform: common.Platform = common.target_platform
     raise ValueError('unsupported platform')
 
 
+@functools.lru_cache
+def get_ar(platform: common.Platform = common.target_platform
+           ) -> str:
+    candidates = []
+
+    if platform == common.local_platform:
+        if 'AR' in os.environ:
+            candidates.append(os.environ['AR'])
+        candidates.append('ar')
+
+    if platform == common.Platform.WINDOWS_AMD64:
+        candidates.append('x86_64-w64-mingw32-ar')
+
+    elif platform == common.Platform.LINUX_GNU_AARCH64:
+        candidates.append('aarch64-linux-gnu-ar')
+
+    elif platform == common.Platform.LINUX_GNU_ARMV7L:
+        candidates.append('arm-linux-gnueabihf-ar')
+
+    elif platform == common.Platform.LINUX_MUSL_X86_64:
+        candidates.append('ar')
+
+    for candidate in candidates:
+        cmd = shutil.which(candidate)
+        if cmd:
+            return cmd
+
+    raise ValueError('unsupported platform')
+
+
 def get_c_flags(platform: common.Platform = common.target_platform
                 ) -> Iterable[str]:
     yield from shlex.split(os.environ.get('CFLAGS', ''))
@@ -274,7 +308,9 @@ class CBuild:
                  c_flags: list[str] = [],
                  ld_flags: list[str] = [],
                  ld_libs: list[str] = [],
-                 task_dep: list[str] = []):
+                 task_dep: list[str] = [],
+                 static_lib_paths: list[Path] = [],
+                 executor: 'ccserver.CompileExecutor | None' = None):
         self._src_paths = src_paths
         self._build_dir = build_dir
         self._src_dir = src_dir
@@ -283,19 +319,26 @@ class CBuild:
         self._ld_flags = ld_flags
         self._ld_libs = ld_libs
         self._task_dep = task_dep
+        self._static_lib_paths = static_lib_paths
+        self._executor = executor
 
     def get_task_exe(self, exe_path: Path) -> dict:
         obj_paths = [self._get_obj_path(src_path)
                      for src_path in self._src_paths]
         yield {'name': str(exe_path),
                'actions': [(common.mkdir_p, [exe_path.parent]),
-                           [get_cc(self._platform),
-                            *get_ld_flags(self._platform, False),
-                            *self._ld_flags,
-                            '-o', str(exe_path),
-                            *(str(obj_path) for obj_path in obj_paths),
-                            *self._ld_libs]],
-               'file_dep': obj_paths,
+                           (common.run_job, [[
+                               get_cc(self._platform),
+                               *get_ld_flags(self._platform, False),
+                               *self._ld_flags,
+                               '-o', str(exe_path),
+                               *(str(obj_path) for obj_path in obj_paths),
+                               *(str(static_lib_path)
+                                 for static_lib_path in self._static_lib_paths),  # NOQA
+                               *self._ld_libs]])],
+               'file_dep': [*obj_paths,
+                            *self._static_lib_paths,
+                            *self._get_thin_static_lib_deps()],
                'task_dep': self._task_dep,
                'targets': [exe_path]}
 
@@ -304,12 +347,33 @@ class CBuild:
                      for src_path in self._src_paths]
         yield {'name': str(lib_path),
                'actions': [(common.mkdir_p, [lib_path.parent]),
-                           [get_cc(self._platform),
-                            *get_ld_flags(self._platform, True),
-                            *self._ld_flags,
-                            '-o', str(lib_path),
-                            *(str(obj_path) for obj_path in obj_paths),
-                            *self._ld_libs]],
+                           (common.run_job, [[
+                               get_cc(self._platform),
+                               *get_ld_flags(self._platform, True),
+                               *self._ld_flags,
+                               '-o', str(lib_path),
+                               *(str(obj_path) for obj_path in obj_paths),
+                               *(str(static_lib_path)
+                                 for static_lib_path in self._static_lib_paths),  # NOQA
+                               *self._ld_libs]])],
+               'file_dep': [*obj_paths,
+                            *self._static_lib_paths,
+                            *self._get_thin_static_lib_deps()],
+               'task_dep': self._task_dep,
+               'targets': [lib_path]}
+
+    def get_task_static_lib(self,
+                            lib_path: Path,
+                            thin: bool = False
+                            ) -> dict:
+        obj_paths = [self._get_obj_path(src_path)
+                     for src_path in self._src_paths]
+        yield {'name': str(lib_path),
+               'actions': [(common.mkdir_p, [lib_path.parent]),
+                           (_update_static_lib, [get_ar(self._platform),
+                                                 lib_path,
+                                                 obj_paths,
+                                                 thin])],
                'file_dep': obj_paths,
                'task_dep': self._task_dep,
                'targets': [lib_path]}
@@ -321,31 +385,52 @@ class CBuild:
             header_paths = _parse_dep(dep_path)
             yield {'name': str(obj_path),
                    'actions': [(common.mkdir_p, [obj_path.parent]),
-                               [get_cc(self._platform),
-                                '-c',
-                                *get_c_flags(self._platform),
-                                *self._c_flags,
-                                '-o', str(obj_path),
-                                str(src_path)]],
+                               self._get_compile_action(src_path,
+                                                        obj_path)],
                    'file_dep': [src_path, dep_path, *header_paths],
                    'task_dep': self._task_dep,
                    'targets': [obj_path]}
 
     def get_task_deps(self) -> dict:
+        cc = get_cc(self._platform)
+        c_flags = [*get_c_flags(self._platform), *self._c_flags]
+
         for src_path in self._src_paths:
             dep_path = self._get_dep_path(src_path)
+            obj_path = self._get_obj_path(src_path)
+            header_paths = _parse_dep(dep_path)
             yield {'name': str(dep_path),
                    'actions': [(common.mkdir_p, [dep_path.parent]),
-                               [get_cc(self._platform),
-                                '-MM',
-                                *get_c_flags(self._platform),
-                                *self._c_flags,
-                                '-o', str(dep_path),
-                                str(src_path)]],
-                   'file_dep': [src_path],
+                               (_write_dep, [cc, c_flags, src_path,
+                                             obj_path, dep_path])],
+                   'file_dep': [src_path, *header_paths],
                    'task_dep': self._task_dep,
                    'targets': [dep_path]}
 
+    def _get_thin_static_lib_deps(self):
+        # thin archive content doesn't change with content of its members
+        for static_lib_path in self._static_lib_paths:
+            if not _is_thin_static_lib(static_lib_path):
+                continue
+
+            for member in _get_static_lib_members(get_ar(self._platform),
+                                                  static_lib_path, True):
+                yield Path(member)
+
+    def _get_compile_action(self, src_path, obj_path):
+        cc = get_cc(self._platform)
+        c_flags = [*get_c_flags(self._platform), *self._c_flags]
+
+        if self._executor:
+            return (self._executor.compile,
+                    [cc, c_flags, src_path, obj_path])
+
+        return (common.run_job, [[cc,
+                                  '-c',
+                                  *c_flags,
+                                  '-o', str(obj_path),
+                                  str(src_path)]])
+
     def _get_dep_path(self, src_path):
         return (self._build_dir /
                 src_path.relative_to(self._src_dir)).with_suffix('.d')
@@ -355,17 +440,206 @@ class CBuild:
                 src_path.relative_to(self._src_dir)).with_suffix('.o')
 
 
-# TODO rewrite
+def _update_static_lib(ar, lib_path, obj_paths, thin, changed):
+    modifiers = 'T' if thin else ''
+    members = [_get_static_lib_member(obj_path, thin)
+               for obj_path in obj_paths]
+
+    # members are replaced by name - archives with duplicate member names,
+    # added or removed members are recreated
+    if (lib_path.exists() and
+            len(set(members)) == len(members) and
+            sorted(_get_static_lib_members(ar, lib_path, thin)) ==
+            sorted(members)):
+        changed = {Path(i) for i in changed}
+        changed_obj_paths = [obj_path for obj_path in obj_paths
+                             if obj_path in changed]
+
+        if changed_obj_paths:
+            common.run_job([ar, f'rcs{modifiers}', str(lib_path),
+                            *(str(obj_path) for obj_path in changed_obj_paths)])  # NOQA
+
+        return
+
+    lib_path.unlink(missing_ok=True)
+    common.run_job([ar, f'qcs{modifiers}', str(lib_path),
+                    *(str(obj_path) for obj_path in obj_paths)])
+
+
+def _get_static_lib_members(ar, lib_path, thin):
+    result = subprocess.run([ar, 't', str(lib_path)],
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL,
+                            universal_newlines=True)
+    if result.returncode:
+        return []
+
+    return [_get_static_lib_member(Path(member), thin)
+            for member in result.stdout.splitlines()]
+
+
+def _is_thin_static_lib(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(8) == b'!<thin>\n'
+
+    except FileNotFoundError:
+        return False
+
+
+def _get_static_lib_member(path, thin):
+    if thin:
+        return os.path.normpath(path.absolute())
+
+    return path.name
+
+
+def _write_dep(cc, c_flags, src_path, obj_path, dep_path):
+    header_paths = _scan_includes(src_path, c_flags)
+    if header_paths is None:
+        common.run_job([cc, '-MM', *c_flags, '-o', str(dep_path),
+                        str(src_path)])
+        return
+
+    lines = [f'{obj_path.name}: {src_path}', *header_paths]
+    dep_path.write_text(' \\\n '.join(lines) + '\n')
+
+
 def _parse_dep(path):
-    if not path.exists():
+    try:
+        content = path.read_text()
+
+    except FileNotFoundError:
         return
 
-    content = path.read_text()
-    if content:
+    _, _, content = content.replace('\\\n', ' ').partition(':')
+    for i in content.split():
+        # removed headers are not dependencies of updated sources
+        if os.path.exists(i):
+            yield Path(i)
+
+
+_include_re = re.compile(rb'^[ \t]*#[ \t]*(include|include_next|import)\b'
+                         rb'[ \t]*(?:"([^"]+)"|<([^>]+)>)?',
+                         re.MULTILINE)
+
+_include_paths_cache = {}
+_include_edges_cache = {}
+_is_file_cache = {}
+
+
+def _scan_includes(src_path, c_flags):
+    include_paths = _get_include_paths(tuple(c_flags))
+    if include_paths is None:
         return
 
-    content = content.split('\n')
-    content[0] = content[0][content[0].find(':')+1:]
-    for i in content:
-        for path in i.replace(' \\\n', '').strip().split(' '):
-            yield Path(path)
+    header_paths = []
+    visited = set()
+    stack = [os.path.normpath(src_path)]
+
+    while stack:
+        path = stack.pop()
+        edges = _get_include_edges(path, include_paths)
+        if edges is None:
+            return
+
+        for header_path in edges:
+            if header_path in visited:
+                continue
+
+            visited.add(header_path)
+            header_paths.append(header_path)
+            stack.append(header_path)
+
+    return header_paths
+
+
+def _get_include_paths(c_flags):
+    if c_flags in _include_paths_cache:
+        return _include_paths_cache[c_flags]
+
+    quote_paths = []
+    paths = []
+
+    flags = iter(c_flags)
+    for flag in flags:
+        # forced includes and altered search rules are left to compiler
+        if flag in ('-include', '-imacros', '-I-'):
+            result = None
+            break
+
+        # headers from system include paths are not dependencies
+        for prefix, flag_paths in (('-iquote', quote_paths),
+                                   ('-isystem', None),
+                                   ('-idirafter', None),
+                                   ('-I', paths)):
+            if not flag.startswith(prefix):
+                continue
+
+            path = flag[len(prefix):] or next(flags, '')
+            if flag_paths is not None:
+                flag_paths.append(os.path.normpath(path))
+
+            break
+
+    else:
+        result = tuple(quote_paths), tuple(paths)
+
+    _include_paths_cache[c_flags] = result
+    return result
+
+
+def _get_include_edges(path, include_paths):
+    key = path, include_paths
+    if key in _include_edges_cache:
+        return _include_edges_cache[key]
+
+    quote_paths, paths = include_paths
+    edges = []
+
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    for match in _include_re.finditer(content):
+        directive, quote_name, angle_name = match.groups()
+
+        # computed includes and search continuation require preprocessor
+        if directive != b'include' or not (quote_name or angle_name):
+            edges = None
+            break
+
+        if quote_name:
+            name = os.fsdecode(quote_name)
+            search_paths = [os.path.dirname(path), *quote_paths, *paths]
+
+        else:
+            name = os.fsdecode(angle_name)
+            search_paths = paths
+
+        header_path = _resolve_include(name, search_paths)
+        if header_path is not None:
+            edges.append(header_path)
+
+    _include_edges_cache[key] = edges
+    return edges
+
+
+def _resolve_include(name, search_paths):
+    if os.path.isabs(name):
+        return os.path.normpath(name) if _is_file(name) else None
+
+    for search_path in search_paths:
+        header_path = os.path.normpath(os.path.join(search_path, name))
+        if _is_file(header_path):
+            return header_path
+
+    # system headers (including not found headers which are expected to
+    # be in default system include paths) are not dependencies
+    return None
+
+
+def _is_file(path):
+    if path not in _is_file_cache:
+        _is_file_cache[path] = os.path.isfile(path)
+
+    return _is_file_cache[path]
@@ -0,0 +1,393 @@
+from collections.abc import Iterable
+from pathlib import Path
+import fnmatch
+import ipaddress
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from . import common
+
+
+default_port: int = 3633
+
+# compile flags (fnmatch patterns) accepted by server
+default_allowed_flags: list[str] = ['-O*', '-g*', '-f*', '-m*', '-W*',
+                                    '-std=*', '-pedantic*', '-ansi', '-w',
+                                    '-pipe', '-pthread']
+
+# flags which could run arbitrary commands or read/write server files
+default_denied_flags: list[str] = ['-fplugin*', '-fdump-*', '-fprofile*',
+                                   '-fauto-profile*', '-fcallgraph-info*',
+                                   '-fcrash-diagnostics*', '-fmodule*',
+                                   '-fsave-optimization-record*',
+                                   '-fopt-info*', '-fdiagnostics-*output*',
+                                   '-fsanitize*list=*', '-fxray-*list=*',
+                                   '-fbasic-block-sections=list=*',
+                                   '-fembed-*', '-Wa,*', '-Wl,*', '-Wp,*']
+
+_header_struct = struct.Struct('>II')
+
+# preprocessor flags (with separate argument) which are applied only
+# during local preprocessing
+_cpp_arg_flags = {'-I', '-D', '-U', '-include', '-imacros', '-isystem',
+                  '-iquote', '-idirafter', '-MF', '-MT', '-MQ'}
+
+_cpp_flags = {'-M', '-MM', '-MD', '-MMD', '-MG', '-MP'}
+
+
+class CompileServer(socketserver.ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = default_port,
+                 *,
+                 cc: str = 'cc',
+                 jobs: int | None = None,
+                 allowed_flags: Iterable[str] = default_allowed_flags,
+                 denied_flags: Iterable[str] = default_denied_flags,
+                 allowed_clients: Iterable[str] | None = None):
+        super().__init__((host, port), _Handler)
+        self._cc = cc
+        self._jobs = jobs or os.cpu_count() or 1
+        self._allowed_flags = list(allowed_flags)
+        self._denied_flags = list(denied_flags)
+        self._allowed_clients = (
+            [ipaddress.ip_network(i, strict=False) for i in allowed_clients]
+            if allowed_clients is not None else None)
+        self._active = 0
+        self._lock = threading.Lock()
+        self._semaphore = threading.Semaphore(self._jobs)
+
+    def get_status(self) -> dict:
+        with self._lock:
+            active = self._active
+
+        return {'jobs': self._jobs,
+                'active': active,
+                'load': os.getloadavg()[0] if hasattr(os, 'getloadavg') else 0}
+
+    def verify_request(self, request, client_address):
+        if self._allowed_clients is None:
+            return True
+
+        address = ipaddress.ip_address(client_address[0])
+        return any(address in i for i in self._allowed_clients)
+
+    def compile(self,
+                flags: list[str],
+                src: bytes
+                ) -> tuple[int, bytes, bytes]:
+        for flag in flags:
+            if not self._is_flag_allowed(flag):
+                raise ValueError(f'compile flag not allowed: {flag}')
+
+        with self._lock:
+            self._active += 1
+
+        try:
+            with self._semaphore:
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    src_path = Path(tmp_dir) / 'src.i'
+                    obj_path = Path(tmp_dir) / 'src.o'
+                    src_path.write_bytes(src)
+
+                    result = subprocess.run([self._cc,
+                                             '-x', 'cpp-output',
+                                             '-c',
+                                             *flags,
+                                             '-o', str(obj_path),
+                                             str(src_path)],
+                                            stdin=subprocess.DEVNULL,
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.STDOUT)
+
+                    obj = (obj_path.read_bytes()
+                           if result.returncode == 0 else b'')
+                    return result.returncode, result.stdout, obj
+
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _is_flag_allowed(self, flag):
+        if any(fnmatch.fnmatchcase(flag, i) for i in self._denied_flags):
+            return False
+
+        return any(fnmatch.fnmatchcase(flag, i) for i in self._allowed_flags)
+
+
+class CompileExecutor:
+
+    def __init__(self,
+                 hosts: Iterable[str] | None = None,
+                 *,
+                 timeout: float = 300,
+                 connect_timeout: float = 1,
+                 status_timeout: float = 1,
+                 retry_delay: float = 30):
+        if hosts is None:
+            hosts = os.environ.get('HAT_DOIT_CC_HOSTS', '').split()
+
+        self._addresses = [_parse_host(host) for host in hosts]
+        self._timeout = timeout
+        self._connect_timeout = connect_timeout
+        self._status_timeout = status_timeout
+        self._retry_delay = retry_delay
+        self._retry_times = {}
+        self._statuses = {}
+        self._statuses_time = None
+
+    def compile(self,
+                cc: str,
+                flags: list[str],
+                src_path: Path,
+                obj_path: Path):
+        local_args = [cc, '-c', *flags, '-o', str(obj_path), str(src_path)]
+
+        addresses = list(self._get_addresses())
+        if not addresses:
+            common.run_job(local_args)
+            return
+
+        src = _preprocess(cc, flags, src_path)
+        compile_flags = list(_get_compile_flags(flags))
+
+        for address in addresses:
+            try:
+                header, obj = _request(address,
+                                       {'type': 'compile',
+                                        'flags': compile_flags},
+                                       src,
+                                       connect_timeout=self._connect_timeout,
+                                       timeout=self._timeout)
+
+            except (OSError, ValueError):
+                self._set_failed(address)
+                continue
+
+            # compilation rejected by server is retried with other host
+            if 'error' in header:
+                continue
+
+            if header['output']:
+                sys.stderr.write(header['output'])
+                sys.stderr.flush()
+
+            if header['returncode']:
+                raise subprocess.CalledProcessError(header['returncode'],
+                                                    local_args)
+
+            obj_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = obj_path.with_name(f'.{obj_path.name}.{os.getpid()}')
+            tmp_path.write_bytes(obj)
+            tmp_path.replace(obj_path)
+            return
+
+        common.run_job(local_args)
+
+    def _get_addresses(self):
+        # host statuses are reused between compilations for
+        # status_timeout instead of querying all hosts for each source
+        now = time.monotonic()
+        if (self._statuses_time is None or
+                now - self._statuses_time >= self._status_timeout):
+            self._statuses = dict(self._query_statuses())
+            self._statuses_time = now
+
+        statuses = sorted((status['active'] / status['jobs'],
+                           status['load'] / status['jobs'],
+                           address)
+                          for address, status in self._statuses.items()
+                          if status['active'] < status['jobs'])
+
+        for *_, address in statuses:
+            yield address
+
+    def _query_statuses(self):
+        now = time.monotonic()
+        for address in self._addresses:
+            if self._retry_times.get(address, now) > now:
+                continue
+
+            try:
+                status, _ = _request(address, {'type': 'status'}, b'',
+                                     connect_timeout=self._connect_timeout,
+                                     timeout=self._connect_timeout)
+
+            except (OSError, ValueError):
+                self._set_failed(address)
+                continue
+
+            self._retry_times.pop(address, None)
+            yield address, status
+
+    def _set_failed(self, address):
+        # failed host is not used until retry_delay expires
+        self._retry_times[address] = time.monotonic() + self._retry_delay
+        self._statuses.pop(address, None)
+
+
+def run_compile_server(host: str = '127.0.0.1',
+                       port: int = default_port,
+                       *,
+                       cc: str | None = None,
+                       jobs: int | None = None,
+                       allowed_flags: Iterable[str] = default_allowed_flags,
+                       denied_flags: Iterable[str] = default_denied_flags,
+                       allowed_clients: Iterable[str] | None = None):
+    from . import c
+
+    cc = cc or c.get_cc(common.local_platform)
+
+    with CompileServer(host, port,
+                       cc=cc,
+                       jobs=jobs,
+                       allowed_flags=allowed_flags,
+                       denied_flags=denied_flags,
+                       allowed_clients=allowed_clients) as server:
+        signal_handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal_handlers[signum] = signal.signal(
+                    signum,
+                    lambda *_: threading.Thread(target=server.shutdown,
+                                                daemon=True).start())
+
+        try:
+            server.serve_forever()
+
+        finally:
+            for signum, signal_handler in signal_handlers.items():
+                signal.signal(signum, signal_handler)
+
+
+def get_task_compile_server(host: str = '127.0.0.1',
+                            port: int = default_port,
+                            *,
+                            cc: str | None = None,
+                            jobs: int | None = None,
+                            **kwargs
+                            ) -> dict:
+    return {'actions': [(run_compile_server, [host, port],
+                         {'cc': cc,
+                          'jobs': jobs,
+                          **kwargs})],
+            'uptodate': [False]}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            header, data = _recv_msg(self.rfile)
+
+        except (OSError, ValueError):
+            return
+
+        if header.get('type') == 'status':
+            _send_msg(self.wfile, self.server.get_status())
+
+        elif header.get('type') == 'compile':
+            try:
+                returncode, output, obj = self.server.compile(header['flags'],
+                                                              data)
+
+            except ValueError as e:
+                _send_msg(self.wfile, {'error': str(e)})
+                return
+
+            _send_msg(self.wfile,
+                      {'returncode': returncode,
+                       'output': output.decode('utf-8', 'replace')},
+                      obj)
+
+
+def _parse_host(host):
+    if host.startswith('['):
+        name, _, port = host[1:].partition(']:')
+
+    else:
+        name, _, port = host.rpartition(':')
+        if not name:
+            name, port = port, ''
+
+    return name, int(port) if port else default_port
+
+
+def _preprocess(cc, flags, src_path):
+    args = [cc, '-E', *flags, str(src_path)]
+
+    jobserver = common.get_jobserver()
+    pass_fds = jobserver.fds if jobserver else []
+
+    with common.job_tokens():
+        return subprocess.run(args,
+                              stdout=subprocess.PIPE,
+                              pass_fds=pass_fds,
+                              check=True).stdout
+
+
+def _get_compile_flags(flags):
+    flags = iter(flags)
+    for flag in flags:
+        if flag in _cpp_arg_flags:
+            next(flags, None)
+
+        elif flag in _cpp_flags:
+            pass
+
+        elif any(flag.startswith(i) and flag != i
+                 for i in ('-I', '-D', '-U', '-MF', '-MT', '-MQ')):
+            pass
+
+        else:
+            yield flag
+
+
+def _request(address, header, data, connect_timeout, timeout):
+    with socket.create_connection(address, timeout=connect_timeout) as s:
+        s.settimeout(timeout)
+
+        with s.makefile('wb') as f:
+            _send_msg(f, header, data)
+
+        s.shutdown(socket.SHUT_WR)
+
+        with s.makefile('rb') as f:
+            return _recv_msg(f)
+
+
+def _send_msg(f, header, data=b''):
+    header_bytes = json.dumps(header).encode('utf-8')
+    f.write(_header_struct.pack(len(header_bytes), len(data)))
+    f.write(header_bytes)
+    f.write(data)
+    f.flush()
+
+
+def _recv_msg(f):
+    header_size, data_size = _header_struct.unpack(
+        _read_exactly(f, _header_struct.size))
+    header = json.loads(_read_exactly(f, header_size))
+    data = _read_exactly(f, data_size)
+    return header, data
+
+
+def _read_exactly(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError('unexpected end of stream')
+
+    return data
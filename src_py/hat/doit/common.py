@@ -1,22 +1,26 @@
 from collections.abc import Iterable
 from pathlib import Path
+import abc
+import collections
+import contextlib
 import datetime
 import enum
+import fnmatch
 import functools
+import hashlib
 import itertools
-import multiprocessing
+import math
 import os
 import platform
+import re
+import select
 import shutil
+import signal
+import stat
+import subprocess
 import sys
+import types
 import typing
-import threading
-
-import packaging.requirements
-import packaging.tags
-import packaging.version
-import watchdog.events
-import watchdog.observers
 
 if sys.version_info[:2] >= (3, 11):
     import tomllib as toml
@@ -47,6 +51,12 @@ class VersionType(enum.Enum):
     PIP = 1
 
 
+class FileChecker(enum.Enum):
+    MD5 = 'md5'
+    TIMESTAMP = 'timestamp'
+    FAST = 'fast'
+
+
 class License(enum.Enum):
     APACHE2 = 'Apache-2.0'
     GPL3 = 'GPLv3'
@@ -71,7 +81,17 @@ target_platform: Platform = (Platform[os.environ['TARGET_PLATFORM'].upper()]
                              if 'TARGET_PLATFORM' in os.environ
                              else local_platform)
 
-local_py_version: PyVersion = PyVersion((packaging.tags.interpreter_name(),
+
+def _get_interpreter_name():
+    # same as packaging.tags.interpreter_name
+    name = sys.implementation.name
+    return {'cpython': 'cp',
+            'pypy': 'pp',
+            'ironpython': 'ip',
+            'jython': 'jy'}.get(name, name)
+
+
+local_py_version: PyVersion = PyVersion((_get_interpreter_name(),
                                          sys.version_info.major,
                                          sys.version_info.minor))
 target_py_version: PyVersion = (
@@ -81,18 +101,54 @@ target_py_version: PyVersion = (
 
 def init(python_paths: Iterable[os.PathLike] = [],
          default_tasks: list[str] = [],
-         verbosity: int = 2
+         verbosity: int = 2,
+         *,
+         job_memory: int | None = None,
+         jobserver: bool = False,
+         trace_path: Path | None = None,
+         file_checker: FileChecker = FileChecker.MD5
          ) -> dict:
     add_python_paths(*python_paths)
-    return {'backend': 'sqlite3',
+
+    num_process = _get_num_process(job_memory)
+
+    if jobserver:
+        _init_jobserver(max(num_process, 1))
+
+    conf = {'backend': 'sqlite3',
             'default_tasks': default_tasks,
             'verbosity': verbosity,
-            'num_process': _get_num_process()}
+            'num_process': num_process}
+
+    if file_checker == FileChecker.FAST:
+        conf['check_file_uptodate'] = FastFileChecker
+        conf['codec_cls'] = _JsonCodec
+
+    else:
+        conf['check_file_uptodate'] = file_checker.value
+
+    if trace_path is None and os.environ.get('DOIT_TRACE'):
+        trace_path = Path(os.environ['DOIT_TRACE'])
+
+    if trace_path is not None:
+        from . import trace as hat_doit_trace
+        conf['reporter'] = hat_doit_trace.create_trace_reporter(trace_path)
+
+    return conf
 
 
-def get_conf(path: Path = Path('pyproject.toml')) -> typing.Any:
-    conf_str = path.read_text()
-    return toml.loads(conf_str)
+def get_conf(path: Path = Path('pyproject.toml'),
+             *,
+             validate: bool = False
+             ) -> typing.Any:
+    path_stat = path.stat()
+    key = path.resolve(), path_stat.st_mtime_ns, path_stat.st_size
+
+    if validate:
+        _validate_conf(*key)
+
+    _, conf = _load_conf(*key)
+    return conf
 
 
 def add_python_paths(*paths: os.PathLike):
@@ -122,25 +178,155 @@ def rm_rf(*paths: os.PathLike):
             p.unlink()
 
 
-def cp_r(src: os.PathLike, dest: os.PathLike):
+def cp_r(src: os.PathLike,
+         dest: os.PathLike,
+         *,
+         sync: bool = False,
+         checksum: bool = False,
+         hardlink: bool = False,
+         prune: bool = False,
+         prune_exclude: Iterable[os.PathLike] = []):
     src = Path(src)
     dest = Path(dest)
-    if src.is_dir():
-        shutil.copytree(str(src), str(dest), dirs_exist_ok=True)
-    else:
-        shutil.copy2(str(src), str(dest))
+    prune_exclude = {dest / i for i in prune_exclude}
+
+    if not sync:
+        if src.is_dir():
+            shutil.copytree(str(src), str(dest), dirs_exist_ok=True)
+        else:
+            shutil.copy2(str(src), str(dest))
+        return
+
+    if not src.is_dir():
+        if dest.is_dir():
+            dest = dest / src.name
+
+        _sync_file(src, dest, src.stat(), checksum, hardlink)
+        return
+
+    dirs = collections.deque([(src, dest)])
+    synced_dirs = collections.deque()
+    while dirs:
+        src_dir, dest_dir = dirs.popleft()
+        synced_dirs.appendleft((src_dir, dest_dir))
+
+        if dest_dir.is_symlink() or dest_dir.is_file():
+            dest_dir.unlink()
+        dest_dir.mkdir(parents=True, exist_ok=True)
+
+        # destination could be read-only copy of read-only source
+        dest_mode = dest_dir.stat().st_mode
+        if dest_mode & stat.S_IRWXU != stat.S_IRWXU:
+            dest_dir.chmod(dest_mode | stat.S_IRWXU)
+
+        names = set()
+        with os.scandir(src_dir) as it:
+            for entry in it:
+                names.add(entry.name)
+
+                if entry.is_dir():
+                    dirs.append((Path(entry.path), dest_dir / entry.name))
+
+                else:
+                    _sync_file(Path(entry.path), dest_dir / entry.name,
+                               entry.stat(), checksum, hardlink)
+
+        if prune:
+            with os.scandir(dest_dir) as it:
+                for entry in it:
+                    if (entry.name not in names and
+                            dest_dir / entry.name not in prune_exclude):
+                        rm_rf(entry.path)
+
+    # directory stats are copied after its subdirectories are synced
+    # (read-only directory can't be updated)
+    for src_dir, dest_dir in synced_dirs:
+        shutil.copystat(src_dir, dest_dir)
+
+
+_FICLONE = 0x40049409
+_copy_file_range_size = 1 << 30
 
 
 def path_rglob(path: Path,
                patterns: list[str] = ['*'],
-               blacklist: set[str] = set()):
+               blacklist: set[str] = set(),
+               cache: bool = False
+               ) -> Iterable[Path]:
     if path.name in blacklist:
         return
+
     if not path.is_dir():
         yield path
-    for i in set(itertools.chain.from_iterable(path.glob(pattern)
-                                               for pattern in patterns)):
-        yield from path_rglob(i, patterns, blacklist)
+        return
+
+    patterns = tuple(patterns)
+    if any(not _is_simple_pattern(pattern) for pattern in patterns):
+        yield from _path_rglob_glob(path, patterns, blacklist)
+        return
+
+    scan_dir = _scan_dir if cache else _scan_dir.__wrapped__
+    match = _get_patterns_regex(patterns).fullmatch
+
+    stack = [(path, iter(scan_dir(path)))]
+    while stack:
+        dir_path, entries = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+            continue
+
+        name, is_dir = entry
+        if name in blacklist or not match(name):
+            continue
+
+        entry_path = dir_path / name
+        if is_dir:
+            stack.append((entry_path, iter(scan_dir(entry_path))))
+
+        else:
+            yield entry_path
+
+
+def _is_simple_pattern(pattern):
+    return ('/' not in pattern and
+            os.sep not in pattern and
+            (os.altsep is None or os.altsep not in pattern) and
+            pattern != '**')
+
+
+@functools.lru_cache
+def _get_patterns_regex(patterns):
+    flags = re.IGNORECASE if os.path.normcase('A') == 'a' else 0
+    return re.compile('|'.join(f'(?:{fnmatch.translate(pattern)})'
+                               for pattern in patterns),
+                      flags)
+
+
+@functools.lru_cache(maxsize=None)
+def _scan_dir(path):
+    with os.scandir(path) as it:
+        entries = [(entry.name, entry.is_dir()) for entry in it]
+    return tuple(sorted(entries))
+
+
+path_rglob.cache_clear = _scan_dir.cache_clear
+
+
+def _path_rglob_glob(path, patterns, blacklist):
+    stack = [path]
+    while stack:
+        path = stack.pop()
+        if path.name in blacklist:
+            continue
+
+        if not path.is_dir():
+            yield path
+            continue
+
+        paths = set(itertools.chain.from_iterable(path.glob(pattern)
+                                                  for pattern in patterns))
+        stack.extend(sorted(paths, reverse=True))
 
 
 @functools.lru_cache
@@ -158,6 +344,8 @@ def get_version(version_type: VersionType = VersionType.SEMVER,
         return version
 
     elif version_type == VersionType.PIP:
+        import packaging.version
+
         return str(packaging.version.Version(version))
 
     raise ValueError()
@@ -167,18 +355,22 @@ def get_task_json_schema_repo(src_paths: Iterable[Path],
                               dst_path: Path,
                               *,
                               file_dep=[],
-                              task_dep=[]
+                              task_dep=[],
+                              cache_dir: Path = Path('build/json_schema_repo')
                               ) -> dict:
     import hat.json
 
-    src_paths = list(src_paths)
+    paths = list(_get_src_paths(src_paths, ['.json', '.yaml', '.yml']))
 
     def generate():
-        repo = hat.json.create_schema_repository(*src_paths)
-        hat.json.encode_file(repo, dst_path, indent=None)
+        schemas = _get_cached_results(_get_cache_path(cache_dir, dst_path),
+                                      paths, hat.json.decode_file)
+        repo = hat.json.create_schema_repository(*schemas)
+        _write_changed(dst_path, hat.json.encode(
+            repo, hat.json.get_file_format(dst_path), indent=None))
 
     return {'actions': [generate],
-            'file_dep': [*src_paths, *file_dep],
+            'file_dep': [*paths, *file_dep],
             'task_dep': task_dep,
             'targets': [dst_path]}
 
@@ -187,70 +379,458 @@ def get_task_sbs_repo(src_paths: Iterable[Path],
                       dst_path: Path,
                       *,
                       file_dep=[],
-                      task_dep=[]
+                      task_dep=[],
+                      cache_dir: Path = Path('build/sbs_repo')
                       ) -> dict:
     import hat.sbs
+    import hat.sbs.parser
     import hat.json
 
-    src_paths = list(src_paths)
+    paths = list(_get_src_paths(src_paths, ['.sbs']))
+
+    def parse(path):
+        module = hat.sbs.parser.parse(path.read_text('utf-8'))
+        return hat.sbs.parser.module_to_json(module)
 
     def generate():
-        repo = hat.sbs.Repository(*src_paths)
-        data = repo.to_json()
-        hat.json.encode_file(data, dst_path, indent=None)
+        modules = _get_cached_results(_get_cache_path(cache_dir, dst_path),
+                                      paths, parse)
+        repo = hat.sbs.Repository.from_json(modules)
+        _write_changed(dst_path, hat.json.encode(
+            repo.to_json(), hat.json.get_file_format(dst_path), indent=None))
 
     return {'actions': [generate],
-            'file_dep': [*src_paths, *file_dep],
+            'file_dep': [*paths, *file_dep],
             'task_dep': task_dep,
             'targets': [dst_path]}
 
 
 def get_task_copy(src_dst_paths: Iterable[tuple[Path, Path]],
                   *,
-                  task_dep=[]
+                  task_dep=[],
+                  watch_delay: float = 0.2
                   ) -> dict:
 
-    class Handler(watchdog.events.FileSystemEventHandler):
-
-        def __init__(self, src_path, dst_path):
-            self._src_path = src_path
-            self._dst_path = dst_path
+    def uptodate(task):
+        task.init_options()
+        if task.options['watch']:
+            _init_signals()
 
-        def on_any_event(self, event):
-            if event.event_type not in {'created', 'deleted', 'modified',
-                                        'moved'}:
-                return
-
-            cp_r(self._src_path, self._dst_path)
+        return False
 
     def action(watch):
-        observer = watchdog.observers.Observer() if watch else None
+        from . import watch as hat_doit_watch
+
+        watcher = hat_doit_watch.Watcher(watch_delay) if watch else None
 
         for src_path, dst_path in src_dst_paths:
             if src_path.is_file():
                 dst_path.parent.mkdir(parents=True, exist_ok=True)
 
-            cp_r(src_path, dst_path)
+            cp_r(src_path, dst_path, sync=True)
 
-            if observer:
-                observer.schedule(Handler(src_path, dst_path), src_path,
-                                  recursive=True)
+            if watcher:
+                watcher.add_handler([src_path],
+                                    functools.partial(_copy_paths,
+                                                      src_path.absolute(),
+                                                      dst_path))
 
-        if observer:
-            observer.start()
-            threading.Event().wait()
-            # observer.stop()
-            # observer.join()
+        if watcher:
+            watcher.run()
 
     return {'actions': [action],
             'task_dep': task_dep,
+            'uptodate': [uptodate],
             'params': [{'name': 'watch',
                         'long': 'watch',
                         'type': bool,
                         'default': False}]}
 
 
-def _get_num_process():
+def _copy_paths(src_path, dst_path, paths):
+    for path in sorted(paths):
+        # existing entries are copied together with parent directory
+        if path.exists() and any(parent in paths for parent in path.parents):
+            continue
+
+        path_dst_path = dst_path / path.relative_to(src_path)
+
+        try:
+            if path.is_dir():
+                cp_r(path, path_dst_path, sync=True)
+
+            elif path.exists():
+                path_dst_path.parent.mkdir(parents=True, exist_ok=True)
+                cp_r(path, path_dst_path, sync=True)
+
+            else:
+                rm_rf(path_dst_path)
+
+        # path changed after event was reported - resulting event will
+        # schedule new copy
+        except FileNotFoundError:
+            pass
+
+
+class JobServer:
+
+    def __init__(self, auth: str):
+        if auth.startswith('fifo:'):
+            path = auth[len('fifo:'):]
+            self._read_fd = os.open(path, os.O_RDWR)
+            self._write_fd = self._read_fd
+            self._nonblocking_fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+        else:
+            self._read_fd, self._write_fd = (int(i) for i in auth.split(','))
+            self._nonblocking_fd = None
+
+            if self._read_fd < 0 or self._write_fd < 0:
+                raise ValueError('jobserver not available')
+
+            os.fstat(self._read_fd)
+            os.fstat(self._write_fd)
+
+            # reopening pipe creates new file description which can be
+            # nonblocking without changing flags shared with other processes
+            with contextlib.suppress(OSError):
+                self._nonblocking_fd = os.open(
+                    f'/proc/self/fd/{self._read_fd}',
+                    os.O_RDONLY | os.O_NONBLOCK)
+
+        # job slot implicitly available to this process (without token)
+        # is shared with forked worker processes
+        self._implicit_read_fd, self._implicit_write_fd = os.pipe()
+        os.set_blocking(self._implicit_read_fd, False)
+        os.write(self._implicit_write_fd, b'+')
+
+    @property
+    def fds(self) -> list[int]:
+        return [self._read_fd, self._write_fd]
+
+    def acquire(self, blocking: bool = True) -> bytes | None:
+        # empty token represents implicit job slot
+        while True:
+            if _read_nonblocking(self._implicit_read_fd):
+                return b''
+
+            if self._nonblocking_fd is None:
+                return os.read(self._read_fd, 1) if blocking else None
+
+            token = _read_nonblocking(self._nonblocking_fd)
+            if token:
+                return token
+
+            if not blocking:
+                return
+
+            select.select([self._implicit_read_fd, self._nonblocking_fd],
+                          [], [])
+
+    def release(self, token: bytes):
+        if token:
+            os.write(self._write_fd, token)
+
+        else:
+            os.write(self._implicit_write_fd, b'+')
+
+
+_jobserver: JobServer | None = None
+
+
+def get_jobserver() -> JobServer | None:
+    return _jobserver
+
+
+@contextlib.contextmanager
+def job_tokens(count: int = 1) -> typing.Iterator[int]:
+    jobserver = get_jobserver()
+    if jobserver is None:
+        yield count
+        return
+
+    tokens = [jobserver.acquire()]
+    try:
+        while len(tokens) < count:
+            token = jobserver.acquire(blocking=False)
+            if token is None:
+                break
+            tokens.append(token)
+
+        yield len(tokens)
+
+    finally:
+        for token in tokens:
+            jobserver.release(token)
+
+
+def run_job(args: list[str], **kwargs):
+    jobserver = get_jobserver()
+    if jobserver is not None:
+        kwargs['pass_fds'] = [*kwargs.get('pass_fds', []), *jobserver.fds]
+
+    with job_tokens():
+        subprocess.run(args, check=True, **kwargs)
+
+
+class FastFileChecker:
+
+    CheckerError = OSError
+
+    def __init__(self):
+        self._digests = {}
+
+    def exists(self, file_path: str) -> bool:
+        return os.path.exists(file_path)
+
+    def info(self, file_path: str) -> os.stat_result:
+        # stat is not reused between tasks - file could be modified by
+        # previously executed task which doesn't declare it as target
+        return os.stat(file_path)
+
+    def check_modified(self,
+                       file_path: str,
+                       file_stat: os.stat_result,
+                       state: typing.Any
+                       ) -> bool:
+        # state is encoded as single string which is faster to decode
+        if not isinstance(state, str):
+            return True
+
+        if state.startswith(_get_file_state_prefix(file_stat)):
+            return False
+
+        try:
+            _, size, _, digest = state.split(':')
+            if int(size, 16) != file_stat.st_size:
+                return True
+
+        except ValueError:
+            return True
+
+        return self._get_digest(file_path, file_stat) != digest
+
+    def get_state(self,
+                  dep: str,
+                  current_state: typing.Any
+                  ) -> str | None:
+        file_stat = os.stat(dep)
+        prefix = _get_file_state_prefix(file_stat)
+
+        if isinstance(current_state, str) and current_state.startswith(prefix):
+            return
+
+        return prefix + self._get_digest(dep, file_stat)
+
+    def _get_digest(self, path, file_stat):
+        key = (path, file_stat.st_mtime_ns, file_stat.st_size,
+               file_stat.st_ino)
+
+        digest = self._digests.get(key)
+        if digest is None:
+            h = hashlib.blake2b(digest_size=16)
+            with open(path, 'rb') as f:
+                while data := f.read(1 << 20):
+                    h.update(data)
+
+            digest = h.hexdigest()
+            self._digests[key] = digest
+
+        return digest
+
+
+class CacheStore(abc.ABC):
+
+    @abc.abstractmethod
+    def get(self, key: str, paths: list[Path]) -> bool:
+        pass
+
+    @abc.abstractmethod
+    def put(self, key: str, paths: list[Path]):
+        pass
+
+
+class FileCacheStore(CacheStore):
+
+    def __init__(self, cache_dir: Path):
+        self._cache_dir = cache_dir
+
+    def get(self, key: str, paths: list[Path]) -> bool:
+        entry_dir = self._cache_dir / key[:2] / key
+        entry_paths = [entry_dir / str(i) for i in range(len(paths))]
+
+        if not all(entry_path.exists() for entry_path in entry_paths):
+            return False
+
+        for entry_path, path in zip(entry_paths, paths):
+            rm_rf(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            cp_r(entry_path, path, sync=True)
+
+        # modification time of entry can be used for least recently used
+        # cleanup
+        os.utime(entry_dir)
+        return True
+
+    def put(self, key: str, paths: list[Path]):
+        entry_dir = self._cache_dir / key[:2] / key
+        if entry_dir.exists():
+            return
+
+        tmp_dir = entry_dir.with_name(f'.{key}.{os.getpid()}')
+        rm_rf(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+
+        try:
+            for i, path in enumerate(paths):
+                cp_r(path, tmp_dir / str(i), sync=True)
+
+            tmp_dir.rename(entry_dir)
+
+        except OSError:
+            if not entry_dir.exists():
+                raise
+
+        finally:
+            rm_rf(tmp_dir)
+
+
+def cache_task(task: dict,
+               *,
+               paths: Iterable[Path] | None = None,
+               store: CacheStore | None = None,
+               salt: str = ''
+               ) -> dict:
+    paths = [Path(path)
+             for path in (task.get('targets', []) if paths is None
+                          else paths)]
+    if not paths:
+        raise ValueError('cached task without paths')
+
+    if store is None:
+        store = FileCacheStore(_get_cache_dir())
+
+    return {**task,
+            'actions': [(_run_cached_actions,
+                         [task['actions'], paths, store, salt])]}
+
+
+@functools.lru_cache(maxsize=32)
+def _load_conf(path, mtime_ns, size):
+    data = toml.loads(path.read_text())
+    return data, _freeze(data)
+
+
+@functools.lru_cache(maxsize=32)
+def _validate_conf(path, mtime_ns, size):
+    import importlib.resources
+
+    import hat.json
+
+    from . import schemas_json as hat_doit_schemas_json
+
+    data, _ = _load_conf(path, mtime_ns, size)
+    tool_conf = data.get('tool', {}).get('hat-doit', {})
+
+    package = importlib.resources.files(hat_doit_schemas_json)
+    with importlib.resources.as_file(package / 'tool.yaml') as schema_path:
+        repo = hat.json.create_schema_repository(schema_path)
+
+    validator = hat.json.DefaultSchemaValidator(repo)
+    validator.validate('hat-doit://tool.yaml', tool_conf)
+
+
+def _freeze(data):
+    if isinstance(data, dict):
+        return types.MappingProxyType({k: _freeze(v)
+                                       for k, v in data.items()})
+
+    if isinstance(data, list):
+        return tuple(_freeze(i) for i in data)
+
+    return data
+
+
+def _sync_file(src_path, dest_path, src_stat, checksum, hardlink):
+    try:
+        dest_stat = dest_path.stat(follow_symlinks=False)
+
+    except FileNotFoundError:
+        dest_stat = None
+
+    if dest_stat is not None:
+        if stat.S_ISDIR(dest_stat.st_mode):
+            rm_rf(dest_path)
+
+        elif _is_same_file(src_path, dest_path, src_stat, dest_stat,
+                           checksum):
+            return
+
+        else:
+            # destination could be hard link to other file
+            dest_path.unlink()
+
+    if hardlink:
+        try:
+            os.link(src_path, dest_path)
+            return
+
+        except OSError:
+            pass
+
+    _clone_file(src_path, dest_path)
+    shutil.copystat(src_path, dest_path)
+
+
+def _is_same_file(src_path, dest_path, src_stat, dest_stat, checksum):
+    if (src_stat.st_dev, src_stat.st_ino) == (dest_stat.st_dev,
+                                              dest_stat.st_ino):
+        return True
+
+    if (not stat.S_ISREG(dest_stat.st_mode) or
+            src_stat.st_size != dest_stat.st_size):
+        return False
+
+    if not checksum:
+        return src_stat.st_mtime_ns == dest_stat.st_mtime_ns
+
+    if _get_file_hash(src_path) != _get_file_hash(dest_path):
+        return False
+
+    if src_stat.st_mtime_ns != dest_stat.st_mtime_ns:
+        shutil.copystat(src_path, dest_path)
+
+    return True
+
+
+def _get_file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while data := f.read(1 << 20):
+            h.update(data)
+    return h.digest()
+
+
+def _clone_file(src_path, dest_path):
+    with open(src_path, 'rb') as src_f, open(dest_path, 'wb') as dest_f:
+        if sys.platform == 'linux':
+            import fcntl
+
+            with contextlib.suppress(OSError):
+                fcntl.ioctl(dest_f.fileno(), _FICLONE, src_f.fileno())
+                return
+
+        if hasattr(os, 'copy_file_range'):
+            with contextlib.suppress(OSError):
+                while os.copy_file_range(src_f.fileno(), dest_f.fileno(),
+                                         _copy_file_range_size):
+                    pass
+                return
+
+    shutil.copyfile(src_path, dest_path)
+
+
+def _get_num_process(job_memory=None):
     num_process = os.environ.get('DOIT_NUM_PROCESS')
 
     if num_process:
@@ -259,4 +839,361 @@ def _get_num_process():
     if sys.platform in ('darwin', 'win32'):
         return 0
 
-    return multiprocessing.cpu_count()
+    num_process = _get_cpu_count()
+
+    if job_memory:
+        memory = _get_memory_limit()
+        if memory is not None:
+            num_process = min(num_process, memory // job_memory)
+
+    return max(num_process, 1)
+
+
+def _init_signals_uptodate():
+    # handlers are installed only if long running task is selected for
+    # execution (before worker processes are started)
+    _init_signals()
+    return False
+
+
+def _init_signals():
+    import multiprocessing
+    import threading
+
+    if multiprocessing.parent_process() is not None:
+        return
+
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    if signal.getsignal(signal.SIGINT) is _on_signal:
+        return
+
+    signal_handlers = {signum: signal.signal(signum, _on_signal)
+                       for signum in (signal.SIGINT, signal.SIGTERM)}
+
+    def restore_signal_handlers():
+        for signum, signal_handler in signal_handlers.items():
+            signal.signal(signum, signal_handler)
+
+    # worker processes keep default behavior of running task actions
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=restore_signal_handlers)
+
+
+def _on_signal(signum, frame):
+    # doit terminates worker processes on SystemExit and exits without
+    # printing traceback of interrupted main process
+    raise SystemExit(128 + signum)
+
+
+def _get_file_state_prefix(file_stat):
+    return (f'{file_stat.st_mtime_ns:x}:{file_stat.st_size:x}:'
+            f'{file_stat.st_ino:x}:')
+
+
+class _JsonCodec:
+
+    def __init__(self):
+        import json
+
+        self._encoder = json.JSONEncoder(separators=(',', ':'),
+                                         check_circular=False)
+        self._decoder = json.JSONDecoder()
+
+    def encode(self, data):
+        return self._encoder.encode(data)
+
+    def decode(self, data):
+        return self._decoder.decode(data)
+
+
+def _get_cpu_count():
+    if hasattr(os, 'sched_getaffinity'):
+        cpu_count = len(os.sched_getaffinity(0))
+
+    else:
+        cpu_count = os.cpu_count() or 1
+
+    for cgroup_dir in _get_cgroup_dirs():
+        try:
+            quota, period = (cgroup_dir / 'cpu.max').read_text().split()
+
+        except (OSError, ValueError):
+            continue
+
+        if quota != 'max':
+            cpu_count = min(cpu_count, math.ceil(int(quota) / int(period)))
+
+    return max(cpu_count, 1)
+
+
+def _get_memory_limit():
+    memory = None
+
+    if hasattr(os, 'sysconf'):
+        with contextlib.suppress(ValueError, OSError):
+            memory = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+    for cgroup_dir in _get_cgroup_dirs():
+        try:
+            limit = (cgroup_dir / 'memory.max').read_text().strip()
+
+        except OSError:
+            continue
+
+        if limit != 'max':
+            memory = (int(limit) if memory is None
+                      else min(memory, int(limit)))
+
+    return memory
+
+
+def _get_cgroup_dirs():
+    # only cgroup v2 unified hierarchy - limits of all ancestors apply
+    try:
+        lines = Path('/proc/self/cgroup').read_text().splitlines()
+
+    except OSError:
+        return
+
+    root_dir = Path('/sys/fs/cgroup')
+    for line in lines:
+        if not line.startswith('0::'):
+            continue
+
+        cgroup_dir = root_dir / line[3:].strip().lstrip('/')
+        yield cgroup_dir
+        for parent in cgroup_dir.parents:
+            if not parent.is_relative_to(root_dir):
+                break
+            yield parent
+
+        break
+
+
+def _init_jobserver(num_process):
+    global _jobserver
+
+    if _jobserver is not None:
+        return
+
+    if not hasattr(os, 'pipe') or sys.platform == 'win32':
+        return
+
+    auth = None
+    for arg in os.environ.get('MAKEFLAGS', '').split():
+        for prefix in ('--jobserver-auth=', '--jobserver-fds='):
+            if arg.startswith(prefix):
+                auth = arg[len(prefix):]
+
+    if auth is not None:
+        with contextlib.suppress(OSError, ValueError):
+            _jobserver = JobServer(auth)
+            return
+
+    read_fd, write_fd = os.pipe()
+    os.set_inheritable(read_fd, True)
+    os.set_inheritable(write_fd, True)
+
+    # one of jobs is run with implicit job slot
+    os.write(write_fd, b'+' * (num_process - 1))
+
+    # pipe descriptors are supported by all make versions (fifo only
+    # by make 4.4 or newer)
+    makeflags = os.environ.get('MAKEFLAGS', '')
+    os.environ['MAKEFLAGS'] = (f"{makeflags} -j{num_process} "
+                               f"--jobserver-auth={read_fd},{write_fd}")
+    _jobserver = JobServer(f'{read_fd},{write_fd}')
+
+
+def _read_nonblocking(fd):
+    try:
+        return os.read(fd, 1)
+
+    except BlockingIOError:
+        return b''
+
+
+def _run_cached_actions(actions, paths, store, salt, task):
+    import doit.action
+
+    key = _get_cache_key(task, actions, paths, salt)
+    if store.get(key, paths):
+        return
+
+    values = {}
+    for action in actions:
+        action = doit.action.create_action(action, task, 'actions')
+        failure = action.execute(out=sys.stdout, err=sys.stderr)
+        if failure:
+            return failure
+
+        values.update(action.values)
+
+    if all(path.exists() for path in paths):
+        store.put(key, paths)
+
+    return values or None
+
+
+def _get_cache_dir():
+    if 'DOIT_CACHE_DIR' in os.environ:
+        return Path(os.environ['DOIT_CACHE_DIR'])
+
+    if 'XDG_CACHE_HOME' in os.environ:
+        return Path(os.environ['XDG_CACHE_HOME']) / 'hat-doit'
+
+    return Path.home() / '.cache' / 'hat-doit'
+
+
+def _get_cache_key(task, actions, paths, salt):
+    h = hashlib.sha256()
+
+    def update(value):
+        data = value if isinstance(value, bytes) else str(value).encode()
+        h.update(len(data).to_bytes(8, 'big'))
+        h.update(data)
+
+    update(salt)
+    update(sys.implementation.cache_tag)
+
+    for path in paths:
+        update(path)
+
+    for action in actions:
+        for i in _get_action_ids(action):
+            update(i)
+
+    for name, value in sorted(task.options.items()):
+        update(name)
+        update(repr(value))
+
+    for path in sorted(task.file_dep):
+        update(path)
+        update(_get_file_hash(path))
+
+    return h.hexdigest()
+
+
+def _get_action_ids(action):
+    if isinstance(action, str):
+        yield action
+
+    elif isinstance(action, list):
+        yield repr([str(i) for i in action])
+
+    elif isinstance(action, tuple):
+        func, *args = action
+        yield from _get_callable_ids(func)
+        yield repr(args)
+
+    else:
+        yield from _get_callable_ids(action)
+
+
+def _get_callable_ids(obj, visited=None):
+    visited = set() if visited is None else visited
+    if id(obj) in visited:
+        return
+    visited.add(id(obj))
+
+    if isinstance(obj, functools.partial):
+        yield from _get_callable_ids(obj.func, visited)
+        yield repr(obj.args)
+        yield repr(obj.keywords)
+        return
+
+    module_name = getattr(obj, '__module__', None)
+    yield f"{module_name}.{getattr(obj, '__qualname__', repr(obj))}"
+
+    # implementation changes are detected by content of whole module
+    module_path = getattr(sys.modules.get(module_name), '__file__', None)
+    if module_path:
+        module_path = Path(module_path)
+        module_stat = module_path.stat()
+        yield _get_module_hash(module_path, module_stat.st_mtime_ns,
+                               module_stat.st_size)
+
+    elif hasattr(obj, '__code__'):
+        yield obj.__code__.co_code
+
+    yield repr(getattr(obj, '__defaults__', None))
+    yield repr(getattr(obj, '__kwdefaults__', None))
+
+    for cell in getattr(obj, '__closure__', None) or []:
+        try:
+            value = cell.cell_contents
+
+        except ValueError:
+            continue
+
+        if isinstance(value, types.ModuleType):
+            yield value.__name__
+
+        elif callable(value) and not isinstance(value, type):
+            yield from _get_callable_ids(value, visited)
+
+        else:
+            yield repr(value)
+
+
+@functools.lru_cache
+def _get_module_hash(path, mtime_ns, size):
+    return _get_file_hash(path)
+
+
+def _get_src_paths(src_paths, suffixes):
+    for src_path in src_paths:
+        if src_path.suffix in suffixes:
+            yield src_path
+
+        else:
+            yield from sorted(path for path in src_path.rglob('*')
+                              if path.suffix in suffixes)
+
+
+def _get_cache_path(cache_dir, dst_path):
+    name = hashlib.sha256(str(dst_path.resolve()).encode()).hexdigest()
+    return cache_dir / f'{name[:16]}.json'
+
+
+def _get_cached_results(cache_path, paths, parse):
+    import hat.json
+
+    try:
+        cache = hat.json.decode_file(cache_path)
+
+    except Exception:
+        cache = {}
+
+    results = []
+    new_cache = {}
+    for path in paths:
+        digest = _get_file_hash(path).hex()
+
+        entry = cache.get(str(path))
+        result = (entry[1] if entry and entry[0] == digest
+                  else parse(path))
+
+        results.append(result)
+        new_cache[str(path)] = [digest, result]
+
+    if new_cache != cache:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        _write_changed(cache_path, hat.json.encode(new_cache))
+
+    return results
+
+
+def _write_changed(path, text):
+    data = text.encode('utf-8')
+
+    with contextlib.suppress(OSError):
+        if path.read_bytes() == data:
+            return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}')
+    tmp_path.write_bytes(data)
+    tmp_path.replace(path)
@@ -1,15 +1,22 @@
 from collections.abc import Iterable
 from pathlib import Path
+import collections
+import concurrent.futures
+import contextlib
 import enum
+import functools
+import hashlib
 import importlib.resources
+import importlib.util
+import itertools
 import json
+import re
 import subprocess
 import sys
 import tempfile
+import threading
 import typing
 
-import sphinx.application
-
 from . import common
 from . import sphinx as hat_doit_sphinx
 
@@ -19,6 +26,91 @@ class SphinxOutputType(enum.Enum):
     LATEX = 'latex'
 
 
+def get_task_build_sphinx(src_dir: Path,
+                          dst_dir: Path,
+                          project: str,
+                          *,
+                          out_type: SphinxOutputType = SphinxOutputType.HTML,
+                          extensions: Iterable[str] = [],
+                          version: str | None = None,
+                          static_paths: Iterable[Path] = [],
+                          conf: dict[str, typing.Any] = {},
+                          file_dep=[],
+                          task_dep=[],
+                          **kwargs
+                          ) -> dict:
+    import doit.tools
+
+    extensions = list(extensions)
+    static_paths = list(static_paths)
+
+    # version is resolved during build - project version is read from
+    # pyproject.toml which is added as file dependency
+    if version is None:
+        file_dep = [Path('pyproject.toml'), *file_dep]
+
+    src_paths = [path
+                 for path in itertools.chain(
+                    common.path_rglob(src_dir, blacklist={'__pycache__'}),
+                    *(common.path_rglob(i) for i in static_paths))
+                 if dst_dir.resolve() not in path.resolve().parents]
+
+    # sphinx reuses pickled environment and rebuilds only changed
+    # documents unless configuration is changed
+    conf_str = json.dumps({'project': project,
+                           'out_type': out_type.value,
+                           'extensions': extensions,
+                           'version': version,
+                           'conf': conf,
+                           **kwargs},
+                          sort_keys=True,
+                          default=str)
+
+    def action():
+        build_sphinx(src_dir=src_dir,
+                     dst_dir=dst_dir,
+                     project=project,
+                     out_type=out_type,
+                     extensions=extensions,
+                     version=version,
+                     static_paths=static_paths,
+                     conf=conf,
+                     **kwargs)
+
+    return {'actions': [action],
+            'file_dep': [*src_paths, *file_dep],
+            'task_dep': task_dep,
+            'targets': [dst_dir / '.doctrees/environment.pickle'],
+            'uptodate': [doit.tools.config_changed(conf_str)]}
+
+
+def get_task_serve_docs(src_dir: Path,
+                        dst_dir: Path,
+                        project: str,
+                        *,
+                        host: str = '127.0.0.1',
+                        port: int = 8000,
+                        task_dep=[],
+                        **kwargs
+                        ) -> dict:
+
+    def action(port):
+        serve_sphinx(src_dir=src_dir,
+                     dst_dir=dst_dir,
+                     project=project,
+                     host=host,
+                     port=port,
+                     **kwargs)
+
+    return {'actions': [action],
+            'task_dep': task_dep,
+            'uptodate': [common._init_signals_uptodate],
+            'params': [{'name': 'port',
+                        'long': 'port',
+                        'type': int,
+                        'default': port}]}
+
+
 def build_sphinx(src_dir: Path,
                  dst_dir: Path,
                  project: str,
@@ -27,54 +119,135 @@ def build_sphinx(src_dir: Path,
                  version: str | None = None,
                  copyright: str = '2020-2025, Hat Open AUTHORS',
                  static_paths: Iterable[Path] = [],
-                 conf: dict[str, typing.Any] = {}):
-    common.mkdir_p(dst_dir)
-    version = common.get_version(common.VersionType.PIP, version)
+                 conf: dict[str, typing.Any] = {},
+                 parallel: int | None = None):
+    if parallel is None:
+        parallel = common._get_num_process()
 
-    package = importlib.resources.files(hat_doit_sphinx)
-    with importlib.resources.as_file(package / 'static') as static_path:
-        conf = {'extensions': ['sphinx.ext.todo',
-                               *extensions],
-                'version': version,
-                'project': project,
-                'copyright': copyright,
-                'html_theme': 'furo',
-                'html_static_path': [str(static_path),
-                                     *(str(i) for i in static_paths)],
-                'html_css_files': ['hat.css'],
-                'html_use_index': False,
-                'html_show_sourcelink': False,
-                'html_show_sphinx': False,
-                'html_sidebars': {'**': ['sidebar/brand.html',
-                                         'sidebar/scroll-start.html',
-                                         'sidebar/navigation.html',
-                                         'sidebar/scroll-end.html']},
-                'todo_include_todos': True,
-                **conf}
+    # sphinx workers are limited by tokens available from jobserver
+    with common.job_tokens(max(parallel, 1)) as count:
+        with _create_sphinx_app(src_dir=src_dir,
+                                dst_dir=dst_dir,
+                                project=project,
+                                out_type=out_type,
+                                extensions=extensions,
+                                version=version,
+                                copyright=copyright,
+                                static_paths=static_paths,
+                                conf=conf,
+                                parallel=count if parallel else 0) as app:
+            app.build()
 
-        app = sphinx.application.Sphinx(srcdir=str(src_dir),
-                                        confdir=None,
-                                        outdir=str(dst_dir),
-                                        doctreedir=str(dst_dir / '.doctrees'),
-                                        buildername=out_type.value,
-                                        confoverrides=conf,
-                                        status=None)
+
+def serve_sphinx(src_dir: Path,
+                 dst_dir: Path,
+                 project: str,
+                 *,
+                 host: str = '127.0.0.1',
+                 port: int = 8000,
+                 delay: float = 0.2,
+                 static_paths: Iterable[Path] = [],
+                 **kwargs):
+    import http.server
+
+    from . import watch as hat_doit_watch
+
+    static_paths = list(static_paths)
+    reload_notifier = _ReloadNotifier()
+
+    # sphinx parallel build forks worker processes which is not safe
+    # while server and watcher threads are running
+    with _create_sphinx_app(src_dir=src_dir,
+                            dst_dir=dst_dir,
+                            project=project,
+                            static_paths=static_paths,
+                            parallel=0,
+                            **kwargs) as app:
         app.build()
 
+        def on_change(paths):
+            dst_path = dst_dir.absolute()
+            if all(path == dst_path or dst_path in path.parents
+                   for path in paths):
+                return
+
+            app.build()
+            reload_notifier.notify()
+
+        watcher = hat_doit_watch.Watcher(delay)
+        watcher.add_handler([src_dir, *static_paths], on_change)
+
+        server = http.server.ThreadingHTTPServer(
+            (host, port),
+            functools.partial(_create_request_handler_cls(),
+                              directory=str(dst_dir),
+                              reload_notifier=reload_notifier))
+        server.daemon_threads = True
+        server_thread = threading.Thread(target=server.serve_forever,
+                                         daemon=True)
+        server_thread.start()
+
+        print(f'serving {dst_dir} at http://{host}:{port}/')
+
+        try:
+            watcher.run()
+
+        finally:
+            server.shutdown()
+            server.server_close()
+
 
 def build_latex(src_dir: Path,
                 dst_dir: Path,
                 n_passes: int = 1):
     common.mkdir_p(dst_dir)
-    for _ in range(n_passes):
-        for i in src_dir.glob('*.tex'):
-            subprocess.run(['xelatex',
-                            '-interaction=batchmode',
-                            f'-output-directory={dst_dir.resolve()}',
-                            i.name],
-                           cwd=src_dir,
-                           stdout=subprocess.DEVNULL,
-                           check=True)
+    src_paths = sorted(src_dir.glob('*.tex'))
+
+    with concurrent.futures.ThreadPoolExecutor(
+            common._get_num_process() or None) as executor:
+        futures = [executor.submit(_build_latex_document, src_dir, dst_dir,
+                                   src_path.name, n_passes)
+                   for src_path in src_paths]
+
+        for future in futures:
+            future.result()
+
+
+def get_task_build_pdoc(modules: Iterable[str],
+                        dst_dir: Path,
+                        *,
+                        exclude: list[str] = [],
+                        file_dep=[],
+                        task_dep=[]
+                        ) -> Iterable[dict]:
+    for module in modules:
+        module_dst_dir = dst_dir / module
+        yield {'name': module,
+               'actions': [(build_pdoc, [module, module_dst_dir, exclude])],
+               'file_dep': [*_get_module_paths(module), *file_dep],
+               'task_dep': task_dep,
+               'targets': [module_dst_dir / 'index.html']}
+
+
+def get_task_build_jsdoc(src_dir: Path,
+                         dst_dir: Path,
+                         *,
+                         file_dep=[],
+                         task_dep=[],
+                         **kwargs
+                         ) -> dict:
+    src_paths = [path for path in common.path_rglob(src_dir)
+                 if _jsdoc_include_re.fullmatch(path.name)]
+
+    def action():
+        build_jsdoc(src_dir=src_dir,
+                    dst_dir=dst_dir,
+                    **kwargs)
+
+    return {'actions': [action],
+            'file_dep': [*src_paths, *file_dep],
+            'task_dep': task_dep,
+            'targets': [dst_dir / 'index.html']}
 
 
 def build_pdoc(module: str,
@@ -118,3 +291,242 @@ def build_jsdoc(src_dir: Path,
         subprocess.run([str(node_modules_dir / '.bin/jsdoc'),
                         '-c', str(conf_path)],
                        check=True)
+
+
+@contextlib.contextmanager
+def _create_sphinx_app(src_dir,
+                       dst_dir,
+                       project,
+                       out_type=SphinxOutputType.HTML,
+                       extensions=[],
+                       version=None,
+                       copyright='2020-2025, Hat Open AUTHORS',
+                       static_paths=[],
+                       conf={},
+                       parallel=None):
+    common.mkdir_p(dst_dir)
+    version = common.get_version(common.VersionType.PIP, version)
+
+    import sphinx.application
+
+    package = importlib.resources.files(hat_doit_sphinx)
+    with importlib.resources.as_file(package / 'static') as static_path:
+        conf = {'extensions': ['sphinx.ext.todo',
+                               *extensions],
+                'version': version,
+                'project': project,
+                'copyright': copyright,
+                'html_theme': 'furo',
+                'html_static_path': [str(static_path),
+                                     *(str(i) for i in static_paths)],
+                'html_css_files': ['hat.css'],
+                'html_use_index': False,
+                'html_show_sourcelink': False,
+                'html_show_sphinx': False,
+                'html_sidebars': {'**': ['sidebar/brand.html',
+                                         'sidebar/scroll-start.html',
+                                         'sidebar/navigation.html',
+                                         'sidebar/scroll-end.html']},
+                'todo_include_todos': True,
+                **conf}
+
+        yield sphinx.application.Sphinx(
+            srcdir=str(src_dir),
+            confdir=None,
+            outdir=str(dst_dir),
+            doctreedir=str(dst_dir / '.doctrees'),
+            buildername=out_type.value,
+            confoverrides=conf,
+            status=None,
+            parallel=(common._get_num_process() if parallel is None
+                      else parallel))
+
+
+def _build_latex_document(src_dir, dst_dir, name, n_passes):
+    stem = Path(name).stem
+    pdf_path = dst_dir / f'{stem}.pdf'
+    digest_path = dst_dir / f'{stem}.digest'
+
+    digest = _get_latex_digest(src_dir, name, n_passes)
+    if (pdf_path.exists() and digest_path.exists() and
+            digest_path.read_text() == digest):
+        return
+
+    digest_path.unlink(missing_ok=True)
+
+    aux_paths = [dst_dir / f'{stem}{suffix}'
+                 for suffix in _latex_aux_suffixes]
+
+    for _ in range(n_passes):
+        aux = [path.read_bytes() if path.exists() else None
+               for path in aux_paths]
+
+        common.run_job(['xelatex',
+                        '-interaction=batchmode',
+                        f'-output-directory={dst_dir.resolve()}',
+                        name],
+                       cwd=src_dir,
+                       stdout=subprocess.DEVNULL)
+
+        # unchanged auxiliary files would result in same output in
+        # next pass
+        if aux == [path.read_bytes() if path.exists() else None
+                   for path in aux_paths]:
+            break
+
+    digest_path.write_text(digest)
+
+
+def _get_latex_digest(src_dir, name, n_passes):
+    h = hashlib.sha256(f'{n_passes}'.encode())
+
+    for path in sorted(_get_latex_input_paths(src_dir, Path(name))):
+        h.update(str(path).encode())
+        h.update(b'\0')
+        h.update((src_dir / path).read_bytes() if (src_dir / path).is_file()
+                 else b'')
+        h.update(b'\0')
+
+    return h.hexdigest()
+
+
+def _get_latex_input_paths(src_dir, path):
+    paths = set()
+    queue = collections.deque([path])
+
+    while queue:
+        path = queue.popleft()
+        if path in paths:
+            continue
+
+        paths.add(path)
+
+        full_path = src_dir / path
+        if not full_path.is_file():
+            continue
+
+        for line in full_path.read_text(errors='replace').split('\n'):
+            line = line.split('%', 1)[0]
+
+            for match in _latex_input_re.finditer(line):
+                input_path = Path(match.group(1).strip())
+                if not input_path.suffix:
+                    input_path = input_path.with_suffix('.tex')
+
+                queue.append(input_path)
+
+    return paths
+
+
+def _get_module_paths(module):
+    spec = importlib.util.find_spec(module)
+    if spec is None:
+        raise ValueError(f'module {module} not found')
+
+    if spec.submodule_search_locations is None:
+        if spec.origin and Path(spec.origin).is_file():
+            yield Path(spec.origin)
+        return
+
+    for location in spec.submodule_search_locations:
+        for path in common.path_rglob(Path(location),
+                                      blacklist={'__pycache__'}):
+            if path.suffix in {'.py', '.pyi'}:
+                yield path
+
+
+# jsdoc default source.includePattern
+_jsdoc_include_re = re.compile(r'.+\.js(doc|x)?')
+
+_latex_aux_suffixes = ['.aux', '.toc', '.lof', '.lot', '.out']
+_latex_input_re = re.compile(r'\\(?:input|include)\{([^}]+)\}')
+
+_reload_path = '/_hat_doit_reload'
+_reload_script = (f"<script>new EventSource('{_reload_path}')"
+                  f".onmessage = () => location.reload();</script>").encode()
+
+
+class _ReloadNotifier:
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._counter = 0
+
+    @property
+    def counter(self) -> int:
+        with self._condition:
+            return self._counter
+
+    def notify(self):
+        with self._condition:
+            self._counter += 1
+            self._condition.notify_all()
+
+    def wait(self, counter: int, timeout: float) -> int:
+        with self._condition:
+            self._condition.wait_for(lambda: self._counter != counter,
+                                     timeout)
+            return self._counter
+
+
+def _create_request_handler_cls():
+    import http.server
+
+    class RequestHandler(http.server.SimpleHTTPRequestHandler):
+
+        def __init__(self, *args, reload_notifier, **kwargs):
+            self._reload_notifier = reload_notifier
+            super().__init__(*args, **kwargs)
+
+        def do_GET(self):
+            if self.path == _reload_path:
+                self._send_reload_events()
+                return
+
+            path = Path(self.translate_path(self.path))
+            if path.is_dir() and self.path.split('?')[0].endswith('/'):
+                path = path / 'index.html'
+
+            if path.suffix != '.html' or not path.is_file():
+                super().do_GET()
+                return
+
+            data = path.read_bytes()
+            index = data.rfind(b'</body>')
+            if index < 0:
+                index = len(data)
+            data = data[:index] + _reload_script + data[index:]
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_reload_events(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+
+            counter = self._reload_notifier.counter
+            try:
+                while True:
+                    new_counter = self._reload_notifier.wait(counter, 15)
+                    if new_counter != counter:
+                        self.wfile.write(b'data: reload\n\n')
+                        counter = new_counter
+
+                    else:
+                        self.wfile.write(b': keepalive\n\n')
+
+                    self.wfile.flush()
+
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return RequestHandler
@@ -1,9 +1,16 @@
+from collections.abc import Iterable
 from pathlib import Path
+import collections
 import enum
+import gzip
+import hashlib
 import importlib.resources
 import itertools
 import json
+import os
+import re
 import subprocess
+import tarfile
 
 from . import common
 from . import eslint as hat_doit_eslint
@@ -16,6 +23,9 @@ def get_task_build_npm(src_dir: Path,
                        task_dep=[],
                        **kwargs):
 
+    version = common.get_version(common.VersionType.SEMVER,
+                                 kwargs.get('version'))
+
     def action():
         build_npm(src_dir=src_dir,
                   build_dir=build_dir,
@@ -24,7 +34,8 @@ def get_task_build_npm(src_dir: Path,
 
     return {'actions': [action],
             'file_dep': file_dep,
-            'task_dep': task_dep}
+            'task_dep': task_dep,
+            'targets': [build_dir / get_npm_tgz_name(name, version)]}
 
 
 def build_npm(src_dir: Path,
@@ -74,14 +85,15 @@ def build_npm(src_dir: Path,
     dst_conf['license'] = license.value
 
     if author is None and src_project_conf.get('authors'):
-        author = src_project_conf['authors'][0]
+        author = dict(src_project_conf['authors'][0])
     if author is not None:
         dst_conf['author'] = author
 
     if contributors is None:
         contributors = [
-            i for i in itertools.chain(src_project_conf.get('authors', []),
-                                       src_project_conf.get('maintainers', []))
+            dict(i)
+            for i in itertools.chain(src_project_conf.get('authors', []),
+                                     src_project_conf.get('maintainers', []))
             if i != author]
         contributors = contributors or None
     if contributors is not None:
@@ -116,26 +128,103 @@ def build_npm(src_dir: Path,
         if dependencies:
             dst_conf['dependencies'] = dependencies
 
-    common.rm_rf(build_dir)
-    common.cp_r(src_dir, build_dir)
-
     if readme_path is None and 'readme' in src_project_conf:
         readme_path = Path(src_project_conf['readme'])
-    if readme_path is not None:
-        dst_readme_path = build_dir / readme_path.with_suffix('.md').name
-        subprocess.run(['pandoc',
-                        str(readme_path),
-                        '-o', str(dst_readme_path)],
-                       check=True)
 
+    tgz_name = get_npm_tgz_name(name, version)
+    dst_readme_path = (build_dir / readme_path.with_suffix('.md').name
+                       if readme_path is not None else None)
     dst_conf_path = build_dir / 'package.json'
-    dst_conf_path.write_text(json.dumps(dst_conf, indent=4),
-                             encoding='utf-8')
 
-    subprocess.run(['npm', 'pack', '--silent'],
-                   stdout=subprocess.DEVNULL,
-                   cwd=str(build_dir),
-                   check=True)
+    state_path = build_dir.with_name(f'{build_dir.name}.state.json')
+    state = (json.loads(state_path.read_text())
+             if state_path.exists() and build_dir.exists() else {})
+    state_path.unlink(missing_ok=True)
+
+    common.cp_r(src_dir, build_dir,
+                sync=True,
+                prune=True,
+                prune_exclude={tgz_name,
+                               dst_conf_path.name,
+                               *([dst_readme_path.name] if dst_readme_path
+                                 else [])})
+
+    if readme_path is not None:
+        readme_digest = [_get_digest(readme_path.read_bytes()),
+                         (_get_digest(dst_readme_path.read_bytes())
+                          if dst_readme_path.exists() else None)]
+
+        if state.get('readme') != readme_digest:
+            subprocess.run(['pandoc',
+                            str(readme_path),
+                            '-o', str(dst_readme_path)],
+                           check=True)
+
+            readme_digest[1] = _get_digest(dst_readme_path.read_bytes())
+
+        state['readme'] = readme_digest
+
+    dst_conf_bytes = json.dumps(dst_conf, indent=4).encode('utf-8')
+    if (not dst_conf_path.exists() or
+            dst_conf_path.read_bytes() != dst_conf_bytes):
+        dst_conf_path.write_bytes(dst_conf_bytes)
+
+    pack_digest = _get_dir_digest(build_dir, {build_dir / tgz_name})
+    if (state.get('pack') != pack_digest or
+            not (build_dir / tgz_name).exists()):
+        pack_npm(build_dir, build_dir / tgz_name)
+
+    state['pack'] = pack_digest
+    state_path.write_text(json.dumps(state))
+
+
+def pack_npm(package_dir: Path,
+             dst_path: Path | None = None
+             ) -> Path:
+    conf = json.loads((package_dir / 'package.json').read_text())
+
+    if dst_path is None:
+        dst_path = package_dir / get_npm_tgz_name(conf['name'],
+                                                  conf['version'])
+
+    paths = sorted(_get_npm_pack_paths(package_dir, conf),
+                   key=lambda i: i.relative_to(package_dir).as_posix())
+
+    tmp_path = dst_path.with_name(f'.{dst_path.name}.tmp')
+    try:
+        with open(tmp_path, 'wb') as f:
+            with gzip.GzipFile(filename='', mode='wb', fileobj=f,
+                               mtime=0) as gz:
+                with tarfile.open(fileobj=gz, mode='w',
+                                  format=tarfile.PAX_FORMAT) as tar:
+                    for path in paths:
+                        if path == dst_path:
+                            continue
+
+                        path_stat = path.stat()
+                        info = tarfile.TarInfo(
+                            'package/' +
+                            path.relative_to(package_dir).as_posix())
+                        info.size = path_stat.st_size
+                        info.mtime = _npm_pack_mtime
+                        info.mode = (0o755 if path_stat.st_mode & 0o111
+                                     else 0o644)
+
+                        with open(path, 'rb') as path_f:
+                            tar.addfile(info, path_f)
+
+        tmp_path.replace(dst_path)
+
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    return dst_path
+
+
+def get_npm_tgz_name(name: str,
+                     version: str
+                     ) -> str:
+    return f"{name.lstrip('@').replace('/', '-')}-{version}.tgz"
 
 
 class ESLintConf(enum.Enum):
@@ -143,16 +232,40 @@ class ESLintConf(enum.Enum):
     TS = 'ts'
 
 
-def run_eslint(path: Path,
-               conf: ESLintConf = ESLintConf.JS):
-    if conf == ESLintConf.JS:
-        parser = 'espree'
+def get_task_run_eslint(src_paths: Iterable[Path],
+                        conf: ESLintConf = ESLintConf.JS,
+                        *,
+                        cache_dir: Path = Path('build/eslint'),
+                        batch_size: int = 100,
+                        daemon: bool = False,
+                        node_modules_dir: Path = Path('node_modules'),
+                        task_dep=[]
+                        ) -> Iterable[dict]:
+    src_paths = sorted(src_paths)
+
+    # paths are assigned to batches by path hash so that adding or
+    # removing paths doesn't change other batches (and their caches) -
+    # doubling of batch count splits each batch in two
+    batch_count = 1 << (max(-(-len(src_paths) // batch_size), 1) -
+                        1).bit_length()
+
+    batches = collections.defaultdict(list)
+    for path in src_paths:
+        batches[_get_eslint_batch_index(path, batch_count)].append(path)
+
+    for i, batch in sorted(batches.items()):
+        name = f'{conf.value}_{i}'
+        yield {'name': name,
+               'actions': [(_run_eslint_batch, [batch, conf, cache_dir,
+                                                cache_dir / f'{name}.cache',
+                                                daemon, node_modules_dir])],
+               'file_dep': batch,
+               'task_dep': task_dep}
 
-    elif conf == ESLintConf.TS:
-        parser = '@typescript-eslint/parser'
 
-    else:
-        raise ValueError('unsupported conf')
+def run_eslint(path: Path,
+               conf: ESLintConf = ESLintConf.JS):
+    parser = _get_eslint_parser(conf)
 
     package = importlib.resources.files(hat_doit_eslint)
     with importlib.resources.as_file(package /
@@ -163,3 +276,226 @@ def run_eslint(path: Path,
                         '-c', str(conf_path),
                         str(path)],
                        check=True)
+
+
+def _run_eslint_batch(paths, conf, conf_dir, cache_path, daemon,
+                      node_modules_dir):
+    parser = _get_eslint_parser(conf)
+    conf_path = _get_eslint_conf_path(conf, conf_dir)
+    cmd = node_modules_dir / '.bin' / ('eslint_d' if daemon else 'eslint')
+
+    subprocess.run([str(cmd),
+                    '--parser', parser,
+                    '--resolve-plugins-relative-to', '.',
+                    '-c', str(conf_path),
+                    '--cache',
+                    '--cache-location', str(cache_path),
+                    *(str(path) for path in paths)],
+                   check=True)
+
+
+def _get_eslint_batch_index(path, batch_count):
+    digest = hashlib.sha256(path.as_posix().encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % batch_count
+
+
+def _get_eslint_parser(conf):
+    if conf == ESLintConf.JS:
+        return 'espree'
+
+    if conf == ESLintConf.TS:
+        return '@typescript-eslint/parser'
+
+    raise ValueError('unsupported conf')
+
+
+def _get_eslint_conf_path(conf, conf_dir):
+    package = importlib.resources.files(hat_doit_eslint)
+    data = (package / f'{conf.value}.yaml').read_bytes()
+
+    conf_path = conf_dir / f'{conf.value}.yaml'
+    if not conf_path.exists() or conf_path.read_bytes() != data:
+        common.mkdir_p(conf_dir)
+
+        # other eslint tasks could be running in parallel
+        tmp_path = conf_dir / f'.{conf_path.name}.{os.getpid()}'
+        tmp_path.write_bytes(data)
+        tmp_path.replace(conf_path)
+
+    return conf_path
+
+
+def _get_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _get_dir_digest(path, exclude):
+    h = hashlib.sha256()
+
+    for i in sorted(common.path_rglob(path)):
+        if i in exclude:
+            continue
+
+        i_stat = i.stat()
+        h.update(f'{i.relative_to(path).as_posix()}\0{i_stat.st_size}\0'
+                 f'{i_stat.st_mtime_ns}\0'.encode())
+
+    return h.hexdigest()
+
+
+# 1985-10-26T08:15:00Z used by npm for all entries
+_npm_pack_mtime = 499162500
+
+_npm_pack_ignore = ['.git', 'CVS', '.svn', '.hg', '.lock-wscript',
+                    '.wafpickle-*', '.*.swp', '.DS_Store', '._*',
+                    'npm-debug.log', '.npmrc', 'node_modules', 'config.gypi',
+                    '*.orig', 'package-lock.json', '.npmignore', '.gitignore']
+
+_npm_pack_include_re = re.compile(
+    r'(package\.json|(readme|license|licence)(\..*)?)', re.IGNORECASE)
+
+
+def _get_npm_pack_paths(package_dir, conf):
+    always_paths = {package_dir / i
+                    for i in _get_npm_conf_paths(conf)}
+
+    files_rules = ([_get_ignore_rule(i) for i in conf['files']]
+                   if 'files' in conf else None)
+    default_rules = [(package_dir, _get_ignore_rule(i))
+                     for i in _npm_pack_ignore]
+
+    dirs = collections.deque([(package_dir, [])])
+    while dirs:
+        dir_path, rules = dirs.popleft()
+
+        if dir_path != package_dir or files_rules is None:
+            rules = [*rules, *_get_ignore_file_rules(dir_path)]
+
+        for entry in sorted(dir_path.iterdir()):
+            is_dir = entry.is_dir()
+
+            if (dir_path == package_dir and not is_dir and
+                    (_npm_pack_include_re.fullmatch(entry.name) or
+                     entry in always_paths)):
+                yield entry
+                continue
+
+            if _is_ignored(entry, is_dir, [*default_rules, *rules]):
+                continue
+
+            if files_rules is not None and not _is_npm_files_included(
+                    entry.relative_to(package_dir), is_dir, files_rules):
+                if not is_dir and entry not in always_paths:
+                    continue
+
+            if is_dir:
+                dirs.append((entry, rules))
+
+            else:
+                yield entry
+
+
+def _get_npm_conf_paths(conf):
+    if isinstance(conf.get('main'), str):
+        yield conf['main']
+
+    if isinstance(conf.get('bin'), str):
+        yield conf['bin']
+
+    elif isinstance(conf.get('bin'), dict):
+        yield from conf['bin'].values()
+
+
+def _get_ignore_file_rules(dir_path):
+    for name in ['.npmignore', '.gitignore']:
+        path = dir_path / name
+        if not path.is_file():
+            continue
+
+        for line in path.read_text(errors='replace').splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield dir_path, _get_ignore_rule(line)
+
+        break
+
+
+def _is_ignored(path, is_dir, rules):
+    ignored = False
+
+    for base_path, (negate, dir_only, pattern_re) in rules:
+        if dir_only and not is_dir:
+            continue
+
+        if pattern_re.fullmatch(path.relative_to(base_path).as_posix()):
+            ignored = not negate
+
+    return ignored
+
+
+def _is_npm_files_included(rel_path, is_dir, rules):
+    included = is_dir
+    paths = [(rel_path, is_dir), *((i, True) for i in rel_path.parents
+                                   if i != Path('.'))]
+
+    for negate, dir_only, pattern_re in rules:
+        if any(pattern_re.fullmatch(path.as_posix())
+               for path, path_is_dir in paths
+               if path_is_dir or not dir_only):
+            included = not negate
+
+    return included
+
+
+def _get_ignore_rule(pattern):
+    negate = pattern.startswith('!')
+    if negate:
+        pattern = pattern[1:]
+
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    if pattern.startswith('./'):
+        pattern = pattern[2:]
+
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            regex += '(?:/.*)?'
+            i += 3
+
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+
+        elif pattern[i] == '[' and ']' in pattern[i+1:]:
+            j = pattern.index(']', i + 1)
+            chars = pattern[i+1:j]
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            regex += f'[{chars}]'
+            i = j + 1
+
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+
+    return negate, dir_only, re.compile(regex)
@@ -1,14 +1,14 @@
 from collections.abc import Iterable
 from pathlib import Path
 import collections
+import concurrent.futures
 import itertools
 import json
+import os
 import subprocess
 import sys
 import tempfile
 
-import mkwhl
-
 from . import common
 
 
@@ -46,15 +46,28 @@ def get_task_build_wheel(src_dir: Path,
 
 def get_task_run_pytest(args=[],
                         *,
+                        coverage: bool = False,
+                        coverage_dir: Path = Path('build/coverage'),
+                        coverage_source: Iterable[str] = [],
+                        loop_scope: str | None = None,
                         file_dep=[],
                         task_dep=[]
                         ) -> dict:
+    coverage_source = list(coverage_source)
 
-    def action(cmd_args):
-        run_pytest(*itertools.chain(args, cmd_args or []))
+    def action(cmd_args, coverage):
+        run_pytest(*itertools.chain(args, cmd_args or []),
+                   coverage=coverage,
+                   coverage_dir=coverage_dir,
+                   coverage_source=coverage_source,
+                   loop_scope=loop_scope)
 
     return {'actions': [action],
             'pos_arg': 'cmd_args',
+            'params': [{'name': 'coverage',
+                        'long': 'coverage',
+                        'type': bool,
+                        'default': coverage}],
             'file_dep': file_dep,
             'task_dep': task_dep}
 
@@ -63,21 +76,38 @@ def get_task_create_pip_requirements(dst_path: Path = Path('requirements.pip.txt
                                      *,
                                      freeze: bool = False,
                                      src_path: Path = Path('pyproject.toml'),
+                                     constraint_paths: Iterable[Path] = [],
+                                     platforms: Iterable[common.Platform] | None = None,  # NOQA
+                                     py_versions: Iterable[common.PyVersion] | None = None,  # NOQA
                                      file_dep=[],
                                      task_dep=[],
                                      **kwargs
                                      ) -> dict:
+    constraint_paths = list(constraint_paths)
+    platforms = list(platforms) if platforms is not None else None
+    py_versions = list(py_versions) if py_versions is not None else None
+    targets = _get_pip_requirements_targets(platforms, py_versions)
+
+    if targets is None:
+        dst_paths = [dst_path]
+
+    else:
+        dst_paths = [get_pip_requirements_path(dst_path, platform, py_version)
+                     for platform, py_version in targets]
 
     def action():
         create_pip_requirements(dst_path,
                                 freeze=freeze,
                                 src_path=src_path,
+                                constraint_paths=constraint_paths,
+                                platforms=platforms,
+                                py_versions=py_versions,
                                 **kwargs)
 
     return {'actions': [action],
-            'file_dep': [src_path, *file_dep],
+            'file_dep': [src_path, *constraint_paths, *file_dep],
             'task_dep': task_dep,
-            'targets': [dst_path],
+            'targets': dst_paths,
             **({'uptodate': [False]} if freeze else {})}
 
 
@@ -94,6 +124,8 @@ def build_wheel(src_dir: Path,
     abi_tag = _get_abi_tag(is_purelib, py_limited_api, py_versions)
     platform_tag = _get_platform_tag(platform)
 
+    import mkwhl
+
     whl_name = mkwhl.create_wheel(src_dir=src_dir,
                                   build_dir=build_dir,
                                   python_tag=python_tag,
@@ -106,13 +138,48 @@ def build_wheel(src_dir: Path,
         whl_name_path.write_text(whl_name)
 
 
-def run_pytest(*args: str):
-    subprocess.run([sys.executable, '-m', 'pytest',
-                    '--capture', 'no',
-                    '-p', 'hat.doit.pytest',
-                    '-p', 'no:cacheprovider',
-                    *args],
-                   check=True)
+def run_pytest(*args: str,
+               coverage: bool = False,
+               coverage_dir: Path = Path('build/coverage'),
+               coverage_source: Iterable[str] = [],
+               loop_scope: str | None = None):
+    pytest_args = ['-m', 'pytest',
+                   '--capture', 'no',
+                   '-p', 'hat.doit.pytest',
+                   '-p', 'no:cacheprovider']
+
+    if loop_scope:
+        pytest_args.extend(
+            ['-o', f'asyncio_default_test_loop_scope={loop_scope}',
+             '-o', f'asyncio_default_fixture_loop_scope={loop_scope}'])
+
+    pytest_args.extend(args)
+
+    if not coverage:
+        common.run_job([sys.executable, *pytest_args])
+        return
+
+    rc_path = _create_coverage_rc(coverage_dir, coverage_source)
+
+    env = {**os.environ,
+           'COVERAGE_RCFILE': str(rc_path.resolve())}
+
+    # sys.monitoring based measurement (without branch coverage) has
+    # significantly lower overhead than default tracer
+    if sys.version_info[:2] >= (3, 12):
+        env.setdefault('COVERAGE_CORE', 'sysmon')
+
+    try:
+        common.run_job([sys.executable, '-m', 'coverage', 'run',
+                        *pytest_args],
+                       env=env)
+
+    except subprocess.CalledProcessError:
+        # missing coverage data of failed run shouldn't mask test failure
+        _report_coverage(rc_path, coverage_dir, ignore_no_data=True)
+        raise
+
+    _report_coverage(rc_path, coverage_dir)
 
 
 def run_flake8(path: Path):
@@ -124,7 +191,10 @@ def create_pip_requirements(dst_path: Path,
                             *,
                             freeze: bool = False,
                             extras: list[str] | None = None,
-                            src_path: Path = Path('pyproject.toml')):
+                            src_path: Path = Path('pyproject.toml'),
+                            constraint_paths: Iterable[Path] = [],
+                            platforms: Iterable[common.Platform] | None = None,
+                            py_versions: Iterable[common.PyVersion] | None = None):  # NOQA
     project_conf = common.get_conf(src_path).get('project', {})
 
     dependencies = collections.deque(project_conf.get('dependencies', []))
@@ -132,30 +202,65 @@ def create_pip_requirements(dst_path: Path,
         if extras is None or k in extras:
             dependencies.extend(v)
 
-    if freeze:
-        # TODO alternative implementation
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            requirements_path = Path(tmp_dir) / 'requirements.txt'
-            report_path = Path(tmp_dir) / 'report.json'
-
-            requirements_path.write_text(
-                ''.join(f"{i}\n" for i in dependencies))
-
-            # TODO platform and constaints
-            subprocess.run([sys.executable, '-m', 'pip', '--quiet',
-                            'install', '--dry-run', '--ignore-installed',
-                            '--quiet', '--report', str(report_path),
-                            '-r', str(requirements_path)],
-                           check=True)
-
-            report = json.loads(report_path.read_text())
-
-        # TODO fix
-        dependencies = [f"{i['metadata']['name']}=={i['metadata']['version']}"
-                        for i in report.get('install', [])]
-
-    dependencies = sorted(dependencies)
-    dst_path.write_text(''.join(f"{i}\n" for i in dependencies))
+    constraint_paths = list(constraint_paths)
+    targets = _get_pip_requirements_targets(platforms, py_versions)
+
+    if targets is None:
+        if freeze:
+            dependencies = _freeze_pip_requirements(dependencies,
+                                                    constraint_paths, None)
+
+        _write_pip_requirements(dst_path, dependencies)
+        return
+
+    # pip evaluates environment markers with host interpreter so markers
+    # of direct dependencies are evaluated for each target (markers of
+    # transitive dependencies are still evaluated by pip)
+    target_dependencies = {
+        target: list(_filter_pip_requirements(dependencies, *target))
+        for target in targets}
+
+    if not freeze:
+        for target in targets:
+            _write_pip_requirements(
+                get_pip_requirements_path(dst_path, *target),
+                target_dependencies[target])
+        return
+
+    if not targets:
+        return
+
+    # first target is resolved alone so that it fills pip's http/wheel
+    # cache with metadata which other targets resolve from
+    first_target, *other_targets = targets
+    _write_pip_requirements(
+        get_pip_requirements_path(dst_path, *first_target),
+        _freeze_pip_requirements(target_dependencies[first_target],
+                                 constraint_paths, first_target))
+
+    if not other_targets:
+        return
+
+    max_workers = min(len(other_targets), os.cpu_count() or 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = {
+            get_pip_requirements_path(dst_path, *target):
+                executor.submit(_freeze_pip_requirements,
+                                target_dependencies[target],
+                                constraint_paths, target)
+            for target in other_targets}
+
+        for path, future in futures.items():
+            _write_pip_requirements(path, future.result())
+
+
+def get_pip_requirements_path(dst_path: Path,
+                              platform: common.Platform,
+                              py_version: common.PyVersion
+                              ) -> Path:
+    py_version_str = ''.join(str(i) for i in py_version.value)
+    return dst_path.with_name(f'{dst_path.stem}.{platform.name.lower()}.'
+                              f'{py_version_str}{dst_path.suffix}')
 
 
 def get_py_versions(py_limited_api: common.PyVersion | None
@@ -183,6 +288,141 @@ def _get_abi_tag(is_purelib, py_limited_api, py_versions):
     return _get_python_tag(py_versions)
 
 
+def _get_pip_requirements_targets(platforms, py_versions):
+    if platforms is None and py_versions is None:
+        return
+
+    if platforms is None:
+        platforms = [common.target_platform]
+
+    if py_versions is None:
+        py_versions = [common.target_py_version]
+
+    return list(itertools.product(platforms, py_versions))
+
+
+def _filter_pip_requirements(dependencies, platform, py_version):
+    import packaging.requirements
+
+    environment = _get_marker_environment(platform, py_version)
+
+    for dependency in dependencies:
+        req = packaging.requirements.Requirement(dependency)
+        if req.marker is None:
+            yield dependency
+            continue
+
+        if not req.marker.evaluate(environment):
+            continue
+
+        req.marker = None
+        yield str(req)
+
+
+def _get_marker_environment(platform, py_version):
+    implementation, major, minor = py_version.value
+    python_version = f'{major}.{minor}'
+
+    if platform == common.Platform.WINDOWS_AMD64:
+        sys_platform, os_name, system = 'win32', 'nt', 'Windows'
+        machine = 'AMD64'
+
+    elif platform == common.Platform.DARWIN_X86_64:
+        sys_platform, os_name, system = 'darwin', 'posix', 'Darwin'
+        machine = 'x86_64'
+
+    else:
+        sys_platform, os_name, system = 'linux', 'posix', 'Linux'
+        machine = platform.value[-1]
+
+    if implementation != 'cp':
+        raise ValueError('unsupported python implementation')
+
+    return {'implementation_name': 'cpython',
+            'implementation_version': f'{python_version}.0',
+            'os_name': os_name,
+            'platform_machine': machine,
+            'platform_python_implementation': 'CPython',
+            'platform_system': system,
+            'python_full_version': f'{python_version}.0',
+            'python_version': python_version,
+            'sys_platform': sys_platform}
+
+
+def _freeze_pip_requirements(dependencies, constraint_paths, target):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        requirements_path = Path(tmp_dir) / 'requirements.txt'
+        report_path = Path(tmp_dir) / 'report.json'
+
+        requirements_path.write_text(
+            ''.join(f"{i}\n" for i in dependencies))
+
+        args = []
+
+        for constraint_path in constraint_paths:
+            args.extend(['-c', str(constraint_path)])
+
+        if target is not None:
+            platform, py_version = target
+            implementation, major, minor = py_version.value
+
+            for platform_tag in _get_pip_platform_tags(platform):
+                args.extend(['--platform', platform_tag])
+
+            args.extend(['--target', str(Path(tmp_dir) / 'target'),
+                         '--only-binary=:all:',
+                         '--implementation', implementation,
+                         '--python-version', f'{major}.{minor}',
+                         '--abi', f'{implementation}{major}{minor}',
+                         '--abi', 'abi3',
+                         '--abi', 'none'])
+
+        subprocess.run([sys.executable, '-m', 'pip', '--quiet',
+                        'install', '--dry-run', '--ignore-installed',
+                        '--quiet', '--report', str(report_path),
+                        '-r', str(requirements_path),
+                        *args],
+                       check=True)
+
+        report = json.loads(report_path.read_text())
+
+    return [_get_pip_report_requirement(i)
+            for i in report.get('install', [])]
+
+
+def _get_pip_report_requirement(item):
+    import packaging.utils
+
+    name = packaging.utils.canonicalize_name(item['metadata']['name'])
+
+    # direct references (urls, local paths) are not available from index
+    if item.get('is_direct'):
+        return f"{name} @ {item['download_info']['url']}"
+
+    return f"{name}=={item['metadata']['version']}"
+
+
+def _write_pip_requirements(dst_path, dependencies):
+    dependencies = sorted(dependencies)
+    dst_path.write_text(''.join(f"{i}\n" for i in dependencies))
+
+
+def _get_pip_platform_tags(platform):
+    platform_tag = _get_platform_tag(platform)
+
+    if platform_tag.startswith('manylinux_2_24_'):
+        arch = platform_tag[len('manylinux_2_24_'):]
+        yield from (f'manylinux_2_{i}_{arch}' for i in range(24, 16, -1))
+        yield f'manylinux2014_{arch}'
+
+    elif platform_tag.startswith('musllinux_1_2_'):
+        arch = platform_tag[len('musllinux_1_2_'):]
+        yield from (f'musllinux_1_{i}_{arch}' for i in range(2, 0, -1))
+
+    else:
+        yield platform_tag
+
+
 def _get_platform_tag(platform):
     if not platform:
         return 'any'
@@ -212,3 +452,48 @@ def _get_platform_tag(platform):
         return 'musllinux_1_2_armv7l'
 
     raise NotImplementedError()
+
+
+def _create_coverage_rc(coverage_dir, coverage_source):
+    common.rm_rf(*coverage_dir.glob('.coverage*'))
+    coverage_dir.mkdir(parents=True, exist_ok=True)
+
+    data_path = (coverage_dir / '.coverage').resolve()
+    lines = ['[run]',
+             f'data_file = {data_path}',
+             'parallel = True',
+             'concurrency =',
+             '    thread',
+             '    multiprocessing',
+             'patch =',
+             '    subprocess',
+             '    _exit',
+             # data of worker processes terminated by multiprocessing
+             # pool (without exit) is saved only by sigterm handler
+             'sigterm = true']
+
+    if coverage_source:
+        lines.append('source =')
+        lines.extend(f'    {i}' for i in coverage_source)
+
+    rc_path = coverage_dir / 'coveragerc'
+    rc_path.write_text(''.join(f'{line}\n' for line in lines))
+    return rc_path
+
+
+def _report_coverage(rc_path, coverage_dir, ignore_no_data=False):
+    import coverage
+
+    cov = coverage.Coverage(config_file=str(rc_path))
+
+    try:
+        cov.combine(strict=True)
+        cov.save()
+
+        cov.html_report(directory=str(coverage_dir / 'html'))
+        cov.xml_report(outfile=str(coverage_dir / 'coverage.xml'))
+        cov.report()
+
+    except coverage.exceptions.NoDataError:
+        if not ignore_no_data:
+            raise
@@ -1,8 +1,10 @@
 from pathlib import Path
+import asyncio
 import collections
 import contextlib
 import cProfile
 import datetime
+import functools
 import time
 
 import pytest
@@ -10,9 +12,24 @@ import pytest
 from . import common
 
 
-tool_conf = common.get_conf().get('tool', {}).get('hat-doit', {})
 durations = collections.deque()
-profile_dir = Path(tool_conf.get('pytest_profile_dir', 'build/profile'))
+
+loop_durations = collections.defaultdict(float)
+
+_loops = []
+_loop_teardown_starts = {}
+_async_nodeids = set()
+_loop_tasks_key = pytest.StashKey[dict]()
+
+
+def __getattr__(name):
+    if name == 'tool_conf':
+        return _get_tool_conf()
+
+    if name == 'profile_dir':
+        return _get_profile_dir()
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def pytest_addoption(parser):
@@ -25,19 +42,67 @@ def pytest_addoption(parser):
     parser.addoption("--perf",
                      action="store_true",
                      help="run performance tests")
+    parser.addoption("--uvloop",
+                     action="store_true",
+                     help="run asyncio tests with uvloop (if installed)")
+    parser.addoption("--loop-report",
+                     action="store_true",
+                     help="report event loop overhead of asyncio tests")
 
 
 def pytest_configure(config):
-    with contextlib.suppress(ImportError):
+    policy = _get_loop_policy(config)
+
+    try:
         import hat.aio
-        hat.aio.init_asyncio()
+        hat.aio.init_asyncio(policy)
+
+    except ImportError:
+        if policy:
+            asyncio.set_event_loop_policy(policy)
 
     config.addinivalue_line("markers", "unit: mark unit test")
     config.addinivalue_line("markers", "sys: mark system test")
     config.addinivalue_line("markers", "perf: mark performance test")
 
 
+def pytest_collection_modifyitems(session, config, items):
+    try:
+        import pytest_asyncio
+
+    except ImportError:
+        return
+
+    _async_nodeids.update(item.nodeid for item in items
+                          if pytest_asyncio.is_async_test(item))
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_fixture_setup(fixturedef, request):
+    start = time.monotonic()
+    result = yield
+
+    if _is_runner(result):
+        _loops.append(result.get_loop())
+        loop_durations['setup'] += time.monotonic() - start
+
+        # finalizer added after setup is called before runner teardown
+        fixturedef.addfinalizer(functools.partial(_on_loop_teardown,
+                                                  fixturedef))
+
+    return result
+
+
+def pytest_fixture_post_finalizer(fixturedef, request):
+    start = _loop_teardown_starts.pop(fixturedef, None)
+    if start is not None:
+        loop_durations['teardown'] += time.monotonic() - start
+
+
+@pytest.hookimpl(tryfirst=True)
 def pytest_runtest_setup(item):
+    item.stash[_loop_tasks_key] = _get_loop_tasks()
+
     options = {option for option in ['unit', 'sys', 'perf']
                if item.config.getoption(f'--{option}')}
     if not options:
@@ -52,7 +117,55 @@ def pytest_runtest_setup(item):
         pytest.skip("test not marked for execution")
 
 
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    # loops created during setup of this item (e.g. first test in module
+    # with module scoped loop) can contain tasks of shared fixtures
+    loop_tasks = item.stash.get(_loop_tasks_key, {})
+    for loop, tasks in _get_loop_tasks().items():
+        loop_tasks.setdefault(loop, tasks)
+
+    return (yield)
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_teardown(item, nextitem):
+    result = yield
+
+    loop_tasks = item.stash.get(_loop_tasks_key, {})
+    for loop, tasks in _get_loop_tasks().items():
+        leaked_tasks = tasks - loop_tasks.get(loop, set())
+        if not leaked_tasks:
+            continue
+
+        item.warn(pytest.PytestWarning(
+            f"{len(leaked_tasks)} asyncio task(s) still pending after test "
+            f"(cancelled): {_get_task_names(leaked_tasks)}"))
+
+        # cancel leaked tasks so they don't run during next test which
+        # shares the same event loop
+        for task in leaked_tasks:
+            task.cancel()
+
+        loop.run_until_complete(
+            asyncio.gather(*leaked_tasks, return_exceptions=True))
+
+    return result
+
+
+def pytest_runtest_logreport(report):
+    if report.nodeid not in _async_nodeids:
+        return
+
+    if report.when == 'call':
+        loop_durations['call'] += report.duration
+        loop_durations['count'] += 1
+
+
 def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    if config.getoption('--loop-report') and loop_durations['count']:
+        _write_loop_report(terminalreporter)
+
     if not durations:
         return
 
@@ -93,7 +206,7 @@ def profile(request):
             yield
 
         suffix = f'.{name}.prof' if name else '.prof'
-        path = (profile_dir /
+        path = (_get_profile_dir() /
                 Path(*request.module.__name__.split('.')) /
                 request.function.__name__).with_suffix(suffix)
 
@@ -101,3 +214,80 @@ def profile(request):
         pr.dump_stats(str(path))
 
     return profile
+
+
+def _get_loop_policy(config):
+    if not config.getoption('--uvloop'):
+        return
+
+    try:
+        import uvloop
+
+    except ImportError:
+        config.issue_config_time_warning(
+            pytest.PytestConfigWarning(
+                "uvloop not installed - using default event loop"),
+            stacklevel=2)
+        return
+
+    return uvloop.EventLoopPolicy()
+
+
+def _is_runner(obj):
+    runner_cls = getattr(asyncio, 'Runner', None)
+
+    if runner_cls is None:
+        try:
+            from backports.asyncio.runner import Runner as runner_cls
+
+        except ImportError:
+            return False
+
+    return isinstance(obj, runner_cls)
+
+
+def _on_loop_teardown(fixturedef):
+    _loop_teardown_starts[fixturedef] = time.monotonic()
+
+
+def _get_loop_tasks():
+    _loops[:] = (loop for loop in _loops if not loop.is_closed())
+
+    return {loop: {task for task in asyncio.all_tasks(loop)
+                   if not task.done()}
+            for loop in _loops}
+
+
+def _get_task_names(tasks):
+    names = sorted(task.get_name() for task in tasks)
+    if len(names) > 5:
+        names = [*names[:5], '...']
+
+    return ', '.join(names)
+
+
+def _write_loop_report(terminalreporter):
+    count = int(loop_durations['count'])
+    overhead = loop_durations['setup'] + loop_durations['teardown']
+    body = loop_durations['call']
+    total = overhead + body
+
+    terminalreporter.write('\nEvent loop report:\n')
+    terminalreporter.write(f"> async tests: {count}\n")
+    terminalreporter.write(
+        f"> loop setup/teardown: {datetime.timedelta(seconds=overhead)} "
+        f"({overhead / (total or 1):.1%}, "
+        f"{overhead / count * 1e3:.3f}ms per test)\n")
+    terminalreporter.write(
+        f"> test body: {datetime.timedelta(seconds=body)} "
+        f"({body / (total or 1):.1%}, "
+        f"{body / count * 1e3:.3f}ms per test)\n")
+
+
+@functools.cache
+def _get_tool_conf():
+    return common.get_conf().get('tool', {}).get('hat-doit', {})
+
+
+def _get_profile_dir():
+    return Path(_get_tool_conf().get('pytest_profile_dir', 'build/profile'))
@@ -0,0 +1,177 @@
+from pathlib import Path
+import json
+import os
+import threading
+import time
+
+import doit.reporter
+import doit.task
+
+
+class TraceReporter(doit.reporter.ConsoleReporter):
+
+    trace_path: Path = Path('build/trace.json')
+
+    def __init__(self, outstream, options):
+        super().__init__(outstream, options)
+        self._tasks = {}
+        self._starts = {}
+        self._traces = {}
+        self._run_start = time.time_ns()
+
+    def initialize(self, tasks, selected_tasks):
+        super().initialize(tasks, selected_tasks)
+        self._tasks = tasks
+
+        # traced task attributes are set in worker process and returned
+        # with other pickle safe task attributes
+        for task in tasks.values():
+            if type(task) is doit.task.Task:
+                task.__class__ = _TracedTask
+
+    def execute_task(self, task):
+        super().execute_task(task)
+        self._starts[task.name] = time.time_ns()
+
+    def add_failure(self, task, fail):
+        super().add_failure(task, fail)
+        self._add_trace(task, 'failure')
+
+    def add_success(self, task):
+        super().add_success(task)
+        self._add_trace(task, 'success')
+
+    def complete_run(self):
+        super().complete_run()
+
+        run_end = time.time_ns()
+        if not self._traces:
+            return
+
+        self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+        self.trace_path.write_text(json.dumps(_get_chrome_trace(
+            self._traces, self._run_start)))
+
+        durations = {name: (trace['end'] - trace['start']) / 1e9
+                     for name, trace in self._traces.items()}
+        duration, path = _get_critical_path(self._tasks, durations)
+        wall_time = (run_end - self._run_start) / 1e9
+        task_time = sum(durations.values())
+
+        self.write(f"trace: {self.trace_path}\n")
+        self.write(f"wall time: {wall_time:.2f}s, "
+                   f"task time: {task_time:.2f}s, "
+                   f"parallelism: {task_time / (wall_time or 1):.2f}\n")
+        self.write(f"critical path: {duration:.2f}s "
+                   f"({len(path)} tasks)\n")
+        for name in path:
+            trace = self._traces[name]
+            self.write(f"  {durations[name]:8.2f}s  "
+                       f"cpu {trace['cpu_time']:.2f}s  "
+                       f"children cpu {trace['children_cpu_time']:.2f}s  "
+                       f"{name}\n")
+
+    def _add_trace(self, task, status):
+        if not task.actions:
+            return
+
+        trace = getattr(task, 'hat_doit_trace', None)
+        if trace is None:
+            start = self._starts.get(task.name)
+            if start is None:
+                return
+
+            # task executed without tracing (e.g. in spawned process)
+            trace = {'start': start,
+                     'end': time.time_ns(),
+                     'pid': os.getpid(),
+                     'tid': 0,
+                     'cpu_time': 0,
+                     'children_cpu_time': 0}
+
+        self._traces[task.name] = {**trace, 'status': status}
+
+
+def create_trace_reporter(trace_path: Path) -> type[TraceReporter]:
+    return type('TraceReporter', (TraceReporter, ),
+                {'trace_path': Path(trace_path)})
+
+
+class _TracedTask(doit.task.Task):
+
+    def execute(self, stream):
+        start = time.time_ns()
+        cpu_time = time.thread_time()
+        children_cpu_time = _get_children_cpu_time()
+
+        try:
+            return super().execute(stream)
+
+        finally:
+            self.hat_doit_trace = {
+                'start': start,
+                'end': time.time_ns(),
+                'pid': os.getpid(),
+                'tid': threading.get_native_id(),
+                'cpu_time': time.thread_time() - cpu_time,
+                'children_cpu_time': (_get_children_cpu_time() -
+                                      children_cpu_time)}
+
+
+def _get_children_cpu_time():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def _get_chrome_trace(traces, run_start):
+    events = []
+
+    pids = {trace['pid'] for trace in traces.values()}
+    worker_pids = sorted(pids - {os.getpid()})
+    for pid in sorted(pids):
+        events.append({'name': 'process_name',
+                       'ph': 'M',
+                       'pid': pid,
+                       'args': {'name': (
+                           f'worker {worker_pids.index(pid)}'
+                           if pid in worker_pids else 'doit')}})
+
+    for name, trace in traces.items():
+        events.append({
+            'name': name,
+            'cat': 'task',
+            'ph': 'X',
+            'ts': (trace['start'] - run_start) / 1e3,
+            'dur': (trace['end'] - trace['start']) / 1e3,
+            'pid': trace['pid'],
+            'tid': trace['tid'],
+            'args': {'status': trace['status'],
+                     'cpu_time': trace['cpu_time'],
+                     'children_cpu_time': trace['children_cpu_time']}})
+
+    return {'traceEvents': events,
+            'displayTimeUnit': 'ms'}
+
+
+def _get_critical_path(tasks, durations):
+    paths = {}
+
+    def get_path(name):
+        if name in paths:
+            return paths[name]
+
+        task = tasks[name]
+        dep_paths = [get_path(dep)
+                     for dep in (*task.task_dep, *task.setup_tasks)
+                     if dep in tasks]
+        dep_duration, dep_path = max(dep_paths, key=lambda i: i[0],
+                                     default=(0, ()))
+
+        duration = durations.get(name, 0)
+        paths[name] = ((dep_duration + duration, (*dep_path, name))
+                       if duration else (dep_duration, dep_path))
+        return paths[name]
+
+    return max((get_path(name) for name in durations),
+               key=lambda i: i[0],
+               default=(0, ()))
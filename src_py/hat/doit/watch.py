@@ -0,0 +1,217 @@
+from collections.abc import Callable, Iterable
+from pathlib import Path
+import inspect
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+import doit.cmd_base
+import doit.loader
+import watchdog.events
+import watchdog.observers
+
+from . import common
+
+
+ChangeHandler = Callable[[set[Path]], None]
+
+
+class Watcher:
+
+    def __init__(self, delay: float = 0.2):
+        self._delay = delay
+        self._handlers = []
+        self._changes = {}
+        self._timer = None
+        self._lock = threading.Lock()
+        self._notify_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._interrupted = False
+
+    def add_handler(self,
+                    paths: Iterable[Path],
+                    handler: ChangeHandler):
+        paths = {Path(path).absolute() for path in paths}
+        self._handlers.append((paths, handler))
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        parent_process = multiprocessing.parent_process()
+
+        signal_handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal_handlers[signum] = signal.signal(
+                    signum, lambda *_: self._interrupt())
+
+        # doit runs tasks in worker processes which are not terminated
+        # if main process is killed
+        if parent_process:
+            threading.Thread(target=self._wait_process,
+                             args=(parent_process,),
+                             daemon=True).start()
+
+        observer = watchdog.observers.Observer()
+        event_handler = _EventHandler(self._on_paths)
+
+        try:
+            for path, recursive in _get_roots(
+                    path for paths, _ in self._handlers for path in paths):
+                observer.schedule(event_handler, str(path),
+                                  recursive=recursive)
+
+            observer.start()
+
+            # signal delivered to other thread doesn't interrupt
+            # blocking wait of main thread which runs signal handlers
+            while not self._stop_event.wait(0.5):
+                pass
+
+        finally:
+            if observer.is_alive():
+                observer.stop()
+                observer.join()
+
+            with self._lock:
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+
+            with self._notify_lock:
+                pass
+
+            for signum, signal_handler in signal_handlers.items():
+                signal.signal(signum, signal_handler)
+
+        # main process is already terminating and waits for worker
+        # process to exit instead of running next task
+        if parent_process and self._interrupted:
+            raise SystemExit(1)
+
+    def _interrupt(self):
+        self._interrupted = True
+        self.stop()
+
+    def _wait_process(self, process):
+        multiprocessing.connection.wait([process.sentinel])
+        self._interrupt()
+
+    def _on_paths(self, paths):
+        with self._lock:
+            for path in paths:
+                for i, (handler_paths, _) in enumerate(self._handlers):
+                    if (path in handler_paths or
+                            any(parent in handler_paths
+                                for parent in path.parents)):
+                        self._changes.setdefault(i, set()).add(path)
+
+            if not self._changes or self._stop_event.is_set():
+                return
+
+            if self._timer:
+                self._timer.cancel()
+
+            self._timer = threading.Timer(self._delay, self._notify)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _notify(self):
+        with self._notify_lock:
+            with self._lock:
+                changes, self._changes = self._changes, {}
+                if self._timer is threading.current_thread():
+                    self._timer = None
+
+            # handlers could rescan changed directories
+            common.path_rglob.cache_clear()
+
+            for i, paths in sorted(changes.items()):
+                _, handler = self._handlers[i]
+                handler(paths)
+
+
+def get_task_watch(task_names: list[str],
+                   *,
+                   dodo_path: Path = Path('dodo.py'),
+                   delay: float = 0.2,
+                   task_dep=[]
+                   ) -> dict:
+
+    def action():
+        file_deps = _get_file_deps(dodo_path, task_names)
+
+        watcher = Watcher(delay)
+        watcher.add_handler(file_deps,
+                            lambda _: _run_tasks(dodo_path, task_names))
+
+        _run_tasks(dodo_path, task_names)
+        watcher.run()
+
+    return {'actions': [action],
+            'task_dep': task_dep,
+            'uptodate': [common._init_signals_uptodate]}
+
+
+class _EventHandler(watchdog.events.FileSystemEventHandler):
+
+    def __init__(self, cb):
+        self._cb = cb
+
+    def on_any_event(self, event):
+        if event.event_type not in {'created', 'deleted', 'modified',
+                                    'moved'}:
+            return
+
+        # directory modification is reported for changes of its entries
+        # which are reported separately
+        if event.is_directory and event.event_type == 'modified':
+            return
+
+        paths = [event.src_path]
+        if event.event_type == 'moved':
+            paths.append(event.dest_path)
+
+        self._cb([Path(os.fsdecode(path)).absolute() for path in paths])
+
+
+def _get_roots(paths):
+    roots = {(path, True) if path.is_dir() else (path.parent, False)
+             for path in paths}
+    recursive_paths = {path for path, recursive in roots if recursive}
+
+    for path, recursive in sorted(roots):
+        if not path.is_dir():
+            continue
+
+        if any(parent in recursive_paths for parent in path.parents):
+            continue
+
+        if not recursive and path in recursive_paths:
+            continue
+
+        yield path, recursive
+
+
+def _get_file_deps(dodo_path, task_names):
+    dodo_module = doit.loader.get_module(str(dodo_path.absolute()))
+    namespace = dict(inspect.getmembers(dodo_module))
+    tasks = {task.name: task
+             for task in doit.loader.load_tasks(namespace)}
+
+    doit.cmd_base.check_tasks_exist(tasks, task_names)
+
+    return {Path(file_dep)
+            for task in doit.cmd_base.tasks_and_deps_iter(tasks, task_names)
+            for file_dep in task.file_dep}
+
+
+def _run_tasks(dodo_path, task_names):
+    subprocess.run([sys.executable, '-m', 'doit',
+                    '-f', str(dodo_path),
+                    *task_names])
@@ -0,0 +1,162 @@
+from pathlib import Path
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from hat.doit import ccserver
+
+
+class Server(ccserver.CompileServer):
+
+    status_count = 0
+
+    def get_status(self):
+        self.status_count += 1
+        return super().get_status()
+
+    compile_count = 0
+
+    def compile(self, flags, src):
+        result = super().compile(flags, src)
+        self.compile_count += 1
+        return result
+
+
+@pytest.fixture
+def create_server():
+    if not shutil.which('cc'):
+        pytest.skip('cc not available')
+
+    servers = []
+
+    def create_server(port=0, **kwargs):
+        server = Server('127.0.0.1', port, **kwargs)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        servers.append((server, thread))
+        return server
+
+    try:
+        yield create_server
+
+    finally:
+        for server, thread in servers:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+
+@pytest.fixture
+def server(create_server):
+    return create_server()
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_c_imports_ccserver_lazily():
+    env = {**os.environ,
+           'PYTHONPATH': str(Path(__file__).parents[1] / 'src_py')}
+    subprocess.run([sys.executable, '-c',
+                    'import sys\n'
+                    'import hat.doit.c\n'
+                    "assert 'hat.doit.ccserver' not in sys.modules\n"],
+                   env=env,
+                   check=True)
+
+
+def test_executor_reuses_host_status(tmp_path, server):
+    host, port = server.server_address
+    executor = ccserver.CompileExecutor([f'{host}:{port}'],
+                                        status_timeout=60)
+
+    for i in range(3):
+        src_path = tmp_path / f'src{i}.c'
+        obj_path = tmp_path / f'src{i}.o'
+        src_path.write_text(f'int f{i}(void) {{ return {i}; }}\n')
+
+        executor.compile('cc', [], src_path, obj_path)
+        assert obj_path.exists()
+
+    assert server.status_count == 1
+
+
+@pytest.mark.parametrize('flags', [['-wrapper', 'touch,wrapper'],
+                                   ['-fplugin=./plugin.so'],
+                                   ['-Wa,-adhln=listing'],
+                                   ['-B', '.'],
+                                   ['-specs=specs'],
+                                   ['@flags']])
+def test_server_rejects_flags(server, flags):
+    header, obj = ccserver._request(server.server_address,
+                                    {'type': 'compile', 'flags': flags},
+                                    b'int f(void) { return 0; }\n',
+                                    connect_timeout=1,
+                                    timeout=10)
+
+    assert 'error' in header
+    assert obj == b''
+    assert server.compile_count == 0
+
+
+def test_executor_rejected_flags(tmp_path, create_server):
+    server = create_server(allowed_flags=['-O*'])
+    host, port = server.server_address
+    executor = ccserver.CompileExecutor([f'{host}:{port}'])
+
+    for i, flags in enumerate([['-O2'], ['-O2', '-g']]):
+        src_path = tmp_path / f'src{i}.c'
+        obj_path = tmp_path / f'src{i}.o'
+        src_path.write_text(f'int f{i}(void) {{ return {i}; }}\n')
+
+        # rejected compilation falls back to local compiler
+        executor.compile('cc', flags, src_path, obj_path)
+        assert obj_path.exists()
+
+    assert server.compile_count == 1
+
+
+def test_server_allowed_clients(tmp_path, create_server):
+    server = create_server(allowed_clients=['10.0.0.0/8'])
+    host, port = server.server_address
+    executor = ccserver.CompileExecutor([f'{host}:{port}'])
+
+    src_path = tmp_path / 'src.c'
+    obj_path = tmp_path / 'src.o'
+    src_path.write_text('int f(void) { return 0; }\n')
+
+    executor.compile('cc', [], src_path, obj_path)
+    assert obj_path.exists()
+    assert server.status_count == 0
+    assert server.compile_count == 0
+
+
+@pytest.mark.parametrize('retry_delay, retried', [(0, True),
+                                                  (60, False)])
+def test_executor_retries_failed_host(tmp_path, create_server, retry_delay,
+                                      retried):
+    port = get_free_port()
+    executor = ccserver.CompileExecutor([f'127.0.0.1:{port}'],
+                                        status_timeout=0,
+                                        retry_delay=retry_delay)
+
+    for i in range(2):
+        src_path = tmp_path / f'src{i}.c'
+        obj_path = tmp_path / f'src{i}.o'
+        src_path.write_text(f'int f{i}(void) {{ return {i}; }}\n')
+
+        executor.compile('cc', [], src_path, obj_path)
+        assert obj_path.exists()
+
+        if i == 0:
+            server = create_server(port)
+
+    assert server.compile_count == (1 if retried else 0)
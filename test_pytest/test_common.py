@@ -0,0 +1,241 @@
+from pathlib import Path
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from hat.doit import common
+
+
+file_checker_dodo = """
+import time
+from hat.doit import common
+
+DOIT_CONFIG = common.init(file_checker=common.FileChecker.{file_checker})
+
+def log(name):
+    with open('log', 'a') as f:
+        f.write(name + '\\n')
+
+def write():
+    with open('f', 'w') as f:
+        f.write(str(time.time_ns()))
+
+def task_t1():
+    return {{'actions': [(log, ['t1'])],
+             'file_dep': ['f']}}
+
+def task_g():
+    return {{'actions': [write],
+             'uptodate': [False]}}
+
+def task_t2():
+    return {{'actions': [(log, ['t2'])],
+             'file_dep': ['f'],
+             'task_dep': ['g']}}
+"""
+
+trace_dodo = """
+import os
+from pathlib import Path
+from hat.doit import common
+
+DOIT_CONFIG = common.init(trace_path=Path('trace.json'))
+
+def write_env():
+    Path('env').write_text(str(os.environ.get('DOIT_TRACE')))
+
+def task_env():
+    return {'actions': [write_env]}
+"""
+
+
+@pytest.fixture
+def jobserver_fifo(tmp_path, monkeypatch):
+    if sys.platform == 'win32':
+        pytest.skip('jobserver not supported')
+
+    fifo_path = tmp_path / 'jobserver'
+    os.mkfifo(fifo_path)
+
+    monkeypatch.setattr(common, '_jobserver', None)
+    monkeypatch.setenv('MAKEFLAGS', f'-j2 --jobserver-auth=fifo:{fifo_path}')
+
+    return fifo_path
+
+
+def test_cp_r_sync_checksum_same_size_and_mtime(tmp_path):
+    src_path = tmp_path / 'src'
+    dest_path = tmp_path / 'dest'
+
+    src_path.write_bytes(b'abc')
+    common.cp_r(src_path, dest_path, sync=True, checksum=True)
+    assert dest_path.read_bytes() == b'abc'
+
+    src_stat = src_path.stat()
+    src_path.write_bytes(b'xyz')
+    os.utime(src_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
+    common.cp_r(src_path, dest_path, sync=True)
+    assert dest_path.read_bytes() == b'abc'
+
+    common.cp_r(src_path, dest_path, sync=True, checksum=True)
+    assert dest_path.read_bytes() == b'xyz'
+
+
+def test_cp_r_sync_read_only_dirs(tmp_path):
+    src_path = tmp_path / 'src'
+    dest_path = tmp_path / 'dest'
+    dir_paths = [src_path, src_path / 'a', src_path / 'a' / 'b']
+
+    dir_paths[-1].mkdir(parents=True)
+    (dir_paths[-1] / 'f').write_text('1')
+
+    def chmod(mode):
+        for dir_path in (dir_paths if mode & 0o200 else reversed(dir_paths)):
+            dir_path.chmod(mode)
+
+    try:
+        chmod(0o555)
+        common.cp_r(src_path, dest_path, sync=True)
+
+        chmod(0o755)
+        (dir_paths[-1] / 'f').write_text('2')
+        chmod(0o555)
+        common.cp_r(src_path, dest_path, sync=True, prune=True)
+
+        assert (dest_path / 'a' / 'b' / 'f').read_text() == '2'
+        for dir_path in [dest_path, dest_path / 'a', dest_path / 'a' / 'b']:
+            assert dir_path.stat().st_mode & 0o777 == 0o555
+
+    finally:
+        for path in [*dir_paths, dest_path, dest_path / 'a',
+                     dest_path / 'a' / 'b']:
+            if path.exists():
+                path.chmod(0o755)
+
+
+def test_path_rglob_cache_clear(tmp_path):
+    (tmp_path / 'a').touch()
+    assert list(common.path_rglob(tmp_path, cache=True)) == [tmp_path / 'a']
+
+    (tmp_path / 'b').touch()
+    assert list(common.path_rglob(tmp_path, cache=True)) == [tmp_path / 'a']
+    assert list(common.path_rglob(tmp_path)) == [tmp_path / 'a',
+                                                 tmp_path / 'b']
+
+    common.path_rglob.cache_clear()
+    assert list(common.path_rglob(tmp_path, cache=True)) == [tmp_path / 'a',
+                                                             tmp_path / 'b']
+
+
+def test_jobserver_requires_opt_in(jobserver_fifo):
+    assert common.get_jobserver() is None
+
+    with common.job_tokens(2) as count:
+        assert count == 2
+
+
+def test_jobserver_implicit_token(jobserver_fifo):
+    common._init_jobserver(2)
+    assert common.get_jobserver() is not None
+
+    common.run_job([sys.executable, '-c', ''])
+
+    with common.job_tokens(2) as count:
+        assert count == 1
+
+    fd = os.open(jobserver_fifo, os.O_RDWR | os.O_NONBLOCK)
+    try:
+        os.write(fd, b'+')
+
+        with common.job_tokens(3) as count:
+            assert count == 2
+
+        assert os.read(fd, 2) == b'+'
+
+    finally:
+        os.close(fd)
+
+
+def test_jobserver_wait_implicit_token(jobserver_fifo):
+    common._init_jobserver(2)
+    acquired = threading.Event()
+
+    def acquire():
+        with common.job_tokens():
+            acquired.set()
+
+    with common.job_tokens():
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        time.sleep(0.1)
+        assert not acquired.is_set()
+
+    thread.join(5)
+    assert acquired.is_set()
+
+
+def test_jobserver_created(tmp_path, monkeypatch):
+    if sys.platform == 'win32':
+        pytest.skip('jobserver not supported')
+
+    monkeypatch.setattr(common, '_jobserver', None)
+    monkeypatch.setenv('MAKEFLAGS', '')
+
+    common._init_jobserver(2)
+    assert '--jobserver-auth=' in os.environ['MAKEFLAGS']
+
+    with common.job_tokens(3) as count:
+        assert count == 2
+
+
+@pytest.mark.parametrize('file_checker', ['MD5', 'FAST'])
+def test_file_checker_dep_modified_by_task_dep(tmp_path, file_checker):
+    (tmp_path / 'dodo.py').write_text(file_checker_dodo.format(
+        file_checker=file_checker))
+    (tmp_path / 'f').write_text('')
+
+    env = {**os.environ,
+           'PYTHONPATH': os.pathsep.join(
+               [str(Path(__file__).parents[1] / 'src_py'),
+                *os.environ.get('PYTHONPATH', '').split(os.pathsep)]),
+           'DOIT_NUM_PROCESS': '0'}
+
+    # g modifies file dependency of t2 without declaring it as target
+    for _ in range(2):
+        subprocess.run([sys.executable, '-m', 'doit', 't1', 'g', 't2'],
+                       cwd=tmp_path,
+                       env=env,
+                       stdout=subprocess.DEVNULL,
+                       check=True)
+
+    log = (tmp_path / 'log').read_text().split()
+    assert log == ['t1', 't2', 't1', 't2']
+
+
+def test_init_trace_path(tmp_path):
+    (tmp_path / 'dodo.py').write_text(trace_dodo)
+
+    env = {**os.environ,
+           'PYTHONPATH': os.pathsep.join(
+               [str(Path(__file__).parents[1] / 'src_py'),
+                *os.environ.get('PYTHONPATH', '').split(os.pathsep)]),
+           'DOIT_NUM_PROCESS': '0'}
+    env.pop('DOIT_TRACE', None)
+
+    subprocess.run([sys.executable, '-m', 'doit', 'env'],
+                   cwd=tmp_path,
+                   env=env,
+                   stdout=subprocess.DEVNULL,
+                   check=True)
+
+    # trace path is not propagated to nested processes
+    assert (tmp_path / 'env').read_text() == 'None'
+
+    trace = json.loads((tmp_path / 'trace.json').read_text())
+    assert any(event['name'] == 'env' for event in trace['traceEvents'])
@@ -0,0 +1,142 @@
+from pathlib import Path
+import itertools
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32',
+                                reason='posix signals and process groups')
+
+dodo = """
+from pathlib import Path
+from hat.doit import common
+from hat.doit.docs import get_task_serve_docs
+
+DOIT_CONFIG = common.init()
+
+def task_serve():
+    return get_task_serve_docs(Path('docs'), Path('build'), 'test',
+                               port={port},
+                               version='0.0.1')
+"""
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until(cond, timeout):
+    start = time.monotonic()
+    while not cond():
+        if time.monotonic() - start > timeout:
+            return False
+        time.sleep(0.05)
+
+    return True
+
+
+def read_url(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as f:
+            return f.read().decode()
+
+    except OSError:
+        return ''
+
+
+def is_group_alive(pgid):
+    try:
+        os.killpg(pgid, 0)
+
+    except ProcessLookupError:
+        return False
+
+    return True
+
+
+@pytest.mark.parametrize('num_process', [0, 2])
+@pytest.mark.parametrize('signum, group', [(signal.SIGTERM, False),
+                                           (signal.SIGINT, True)])
+def test_serve_shutdown(tmp_path, num_process, signum, group):
+    pytest.importorskip('sphinx')
+
+    port = get_free_port()
+    url = f'http://127.0.0.1:{port}/index.html'
+    index_path = tmp_path / 'docs/index.rst'
+    index_path.parent.mkdir()
+    index_path.write_text('title\n=====\n')
+    (tmp_path / 'dodo.py').write_text(dodo.format(port=port))
+
+    env = {**os.environ,
+           'PYTHONPATH': os.pathsep.join(
+               [str(Path(__file__).parents[1] / 'src_py'),
+                *os.environ.get('PYTHONPATH', '').split(os.pathsep)]),
+           'DOIT_NUM_PROCESS': str(num_process)}
+
+    p = subprocess.Popen([sys.executable, '-m', 'doit', 'serve'],
+                         cwd=tmp_path,
+                         env=env,
+                         stdin=subprocess.DEVNULL,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT,
+                         start_new_session=True)
+
+    try:
+        assert wait_until(lambda: 'title' in read_url(url), 60)
+
+        # server is started before watcher
+        start = time.monotonic()
+        for i in itertools.count():
+            index_path.write_text(f'title\n=====\n\ncontent{i}\n')
+            if wait_until(lambda: f'content{i}' in read_url(url), 2):
+                break
+
+            assert time.monotonic() - start < 60
+
+        if group:
+            os.killpg(p.pid, signum)
+
+        else:
+            os.kill(p.pid, signum)
+
+        returncode = p.wait(10)
+        assert wait_until(lambda: not is_group_alive(p.pid), 10)
+
+    finally:
+        if is_group_alive(p.pid):
+            os.killpg(p.pid, signal.SIGKILL)
+        p.wait()
+
+    output = p.stdout.read().decode()
+    p.stdout.close()
+
+    assert returncode == (128 + signum if num_process else 0)
+    assert 'Traceback' not in output
+
+    with socket.socket() as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(('127.0.0.1', port))
+
+
+def test_build_sphinx_task_version(tmp_path, monkeypatch):
+    from hat.doit import docs
+
+    # pyproject.toml is not read during task creation
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'docs').mkdir()
+
+    task = docs.get_task_build_sphinx(Path('docs'), Path('build'), 'test')
+    assert Path('pyproject.toml') in task['file_dep']
+
+    task = docs.get_task_build_sphinx(Path('docs'), Path('build'), 'test',
+                                      version='0.0.1')
+    assert Path('pyproject.toml') not in task['file_dep']
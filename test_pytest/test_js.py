@@ -0,0 +1,25 @@
+from pathlib import Path
+
+from hat.doit import js
+
+
+def get_batches(src_paths):
+    return {task['name']: task['file_dep']
+            for task in js.get_task_run_eslint(src_paths, batch_size=10)}
+
+
+def test_eslint_batches_stable():
+    src_paths = [Path(f'src/{i}.js') for i in range(35)]
+    batches = get_batches(src_paths)
+
+    batch_paths = [path for batch in batches.values() for path in batch]
+    assert sorted(batch_paths) == sorted(src_paths)
+
+    for changed_paths in [src_paths[1:],
+                          src_paths[:-1],
+                          [Path('src/a.js'), *src_paths]]:
+        changed_batches = get_batches(changed_paths)
+
+        assert changed_batches.keys() == batches.keys()
+        assert sum(changed_batches[name] != batches[name]
+                   for name in batches) == 1
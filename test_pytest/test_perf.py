@@ -0,0 +1,26 @@
+import os
+import shutil
+
+import pytest
+
+from hat.doit import benchmark
+
+
+pytestmark = pytest.mark.perf
+
+
+@pytest.mark.parametrize('scenario', list(benchmark.Scenario))
+def test_benchmark(tmp_path, scenario):
+    if scenario == benchmark.Scenario.C and not shutil.which('cc'):
+        pytest.skip('cc not available')
+
+    results = benchmark.run_benchmark(scenario, tmp_path / scenario.value,
+                                      scale=0.05,
+                                      repeat=1)
+
+    measurements = set(benchmark.Measurement)
+    if not hasattr(os, 'wait4'):
+        measurements.remove(benchmark.Measurement.MEMORY)
+
+    assert set(results) == measurements
+    assert all(value > 0 for value in results.values())
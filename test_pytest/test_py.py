@@ -0,0 +1,116 @@
+from pathlib import Path
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+from hat.doit import common
+from hat.doit import py
+
+
+@pytest.fixture
+def pytest_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('PYTHONPATH', os.pathsep.join(
+        [str(Path(__file__).parents[1] / 'src_py'),
+         *os.environ.get('PYTHONPATH', '').split(os.pathsep)]))
+
+    return tmp_path
+
+
+def test_run_pytest_coverage_failure(pytest_dir):
+    test_path = pytest_dir / 'test_fail.py'
+    test_path.write_text('def test_fail():\n'
+                         '    assert False\n')
+
+    # no data is collected for not imported source
+    with pytest.raises(subprocess.CalledProcessError):
+        py.run_pytest(str(test_path),
+                      coverage=True,
+                      coverage_dir=pytest_dir / 'coverage',
+                      coverage_source=['not_imported'])
+
+
+@pytest.mark.parametrize('loop_scope, same_loop', [(None, False),
+                                                   ('module', True)])
+def test_run_pytest_loop_scope(pytest_dir, loop_scope, same_loop):
+    test_path = pytest_dir / 'test_loop.py'
+    test_path.write_text('import asyncio\n'
+                         'loops = []\n'
+                         'async def test_1():\n'
+                         '    loops.append(asyncio.get_running_loop())\n'
+                         'async def test_2():\n'
+                         '    loops.append(asyncio.get_running_loop())\n'
+                         f'    assert (loops[0] is loops[1]) == {same_loop}\n')
+
+    py.run_pytest(str(test_path),
+                  '-o', 'asyncio_mode=auto',
+                  loop_scope=loop_scope)
+
+
+def test_run_pytest_loop_report(pytest_dir):
+    test_path = pytest_dir / 'test_loop.py'
+    test_path.write_text('import asyncio\n'
+                         'import pytest\n'
+                         '@pytest.fixture\n'
+                         'async def slow():\n'
+                         '    await asyncio.sleep(0.5)\n'
+                         '    yield\n'
+                         '    await asyncio.sleep(0.5)\n'
+                         'async def test_1(slow):\n'
+                         '    pass\n')
+
+    result = subprocess.run([sys.executable, '-m', 'pytest',
+                             '-p', 'hat.doit.pytest',
+                             '-o', 'asyncio_mode=auto',
+                             '--loop-report',
+                             str(test_path)],
+                            stdout=subprocess.PIPE,
+                            check=True)
+
+    # fixture setup/teardown is not included in loop overhead
+    match = re.search(r'loop setup/teardown: (\d+):(\d+):([\d.]+)',
+                      result.stdout.decode())
+    hours, minutes, seconds = match.groups()
+    assert int(hours) == 0
+    assert int(minutes) == 0
+    assert float(seconds) < 0.5
+
+
+def test_create_pip_requirements_target_markers(tmp_path):
+    src_path = tmp_path / 'pyproject.toml'
+    src_path.write_text('[project]\n'
+                        'dependencies = [\n'
+                        '    "doit >=0.36.0",\n'
+                        '    "tomli >=2.0.1; python_version<\'3.11\'",\n'
+                        '    "colorama; sys_platform==\'win32\'",\n'
+                        ']\n')
+    dst_path = tmp_path / 'requirements.txt'
+    platforms = [common.Platform.WINDOWS_AMD64,
+                 common.Platform.LINUX_GNU_X86_64]
+    py_versions = [common.PyVersion.CP310,
+                   common.PyVersion.CP311]
+
+    py.create_pip_requirements(dst_path,
+                               src_path=src_path,
+                               platforms=platforms,
+                               py_versions=py_versions)
+
+    def get_requirements(platform, py_version):
+        path = py.get_pip_requirements_path(dst_path, platform, py_version)
+        return path.read_text().splitlines()
+
+    assert get_requirements(common.Platform.WINDOWS_AMD64,
+                            common.PyVersion.CP310) == ['colorama',
+                                                        'doit >=0.36.0',
+                                                        'tomli>=2.0.1']
+    assert get_requirements(common.Platform.WINDOWS_AMD64,
+                            common.PyVersion.CP311) == ['colorama',
+                                                        'doit >=0.36.0']
+    assert get_requirements(common.Platform.LINUX_GNU_X86_64,
+                            common.PyVersion.CP310) == ['doit >=0.36.0',
+                                                        'tomli>=2.0.1']
+    assert get_requirements(common.Platform.LINUX_GNU_X86_64,
+                            common.PyVersion.CP311) == ['doit >=0.36.0']
@@ -0,0 +1,190 @@
+from pathlib import Path
+import itertools
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32',
+                                reason='posix signals and process groups')
+
+dodo = """
+from pathlib import Path
+from hat.doit import common
+from hat.doit.watch import get_task_watch
+
+DOIT_CONFIG = common.init()
+
+def task_build():
+    return {'actions': [(common.cp_r, [Path('src'), Path('build')])],
+            'file_dep': [Path('src')],
+            'targets': [Path('build')]}
+
+def task_watch():
+    return get_task_watch(['build'])
+
+def task_copy():
+    return common.get_task_copy([(Path('src'), Path('copy'))])
+
+def write_sigint():
+    import signal
+    Path('sigint').write_text(
+        str(signal.getsignal(signal.SIGINT) is signal.default_int_handler))
+
+def task_sigint():
+    return {'actions': [write_sigint]}
+"""
+
+
+def wait_watching(src_path, dst_path, timeout=10):
+    start = time.monotonic()
+
+    # initial build is run before watcher is started
+    if not wait_until(lambda: read_text(dst_path) == '', timeout):
+        raise TimeoutError()
+
+    for i in itertools.count(1):
+        src_path.write_text(str(i))
+
+        if wait_until(lambda: read_text(dst_path) == str(i), 0.5):
+            return
+
+        if time.monotonic() - start > timeout:
+            raise TimeoutError()
+
+
+def wait_until(cond, timeout):
+    start = time.monotonic()
+    while not cond():
+        if time.monotonic() - start > timeout:
+            return False
+        time.sleep(0.05)
+
+    return True
+
+
+def read_text(path):
+    try:
+        return path.read_text()
+
+    except OSError:
+        return None
+
+
+def is_group_alive(pgid):
+    try:
+        os.killpg(pgid, 0)
+
+    except ProcessLookupError:
+        return False
+
+    return True
+
+
+@pytest.mark.parametrize('num_process', [0, 2])
+@pytest.mark.parametrize('args, dst', [(['watch'], 'build'),
+                                       (['copy', '--watch'], 'copy')])
+@pytest.mark.parametrize('signum, group', [(signal.SIGTERM, False),
+                                           (signal.SIGINT, True)])
+def test_shutdown(tmp_path, num_process, args, dst, signum, group):
+    src_path = tmp_path / 'src'
+    dst_path = tmp_path / dst
+    (tmp_path / 'dodo.py').write_text(dodo)
+    src_path.write_text('')
+
+    env = {**os.environ,
+           'PYTHONPATH': os.pathsep.join(
+               [str(Path(__file__).parents[1] / 'src_py'),
+                *os.environ.get('PYTHONPATH', '').split(os.pathsep)])}
+    env['DOIT_NUM_PROCESS'] = str(num_process)
+
+    p = subprocess.Popen([sys.executable, '-m', 'doit', *args],
+                         cwd=tmp_path,
+                         env=env,
+                         stdin=subprocess.DEVNULL,
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT,
+                         start_new_session=True)
+
+    try:
+        wait_watching(src_path, dst_path)
+
+        if group:
+            os.killpg(p.pid, signum)
+
+        else:
+            os.kill(p.pid, signum)
+
+        returncode = p.wait(10)
+        assert wait_until(lambda: not is_group_alive(p.pid), 10)
+
+    finally:
+        if is_group_alive(p.pid):
+            os.killpg(p.pid, signal.SIGKILL)
+        p.wait()
+
+    output = p.stdout.read().decode()
+    p.stdout.close()
+
+    # watcher in main process stops without terminating doit
+    assert returncode == (128 + signum if num_process else 0)
+    assert 'Traceback' not in output
+
+
+@pytest.mark.parametrize('args', [['sigint'],
+                                  ['copy', 'sigint']])
+def test_build_keeps_sigint_handler(tmp_path, args):
+    (tmp_path / 'dodo.py').write_text(dodo)
+    (tmp_path / 'src').write_text('')
+
+    env = {**os.environ,
+           'PYTHONPATH': os.pathsep.join(
+               [str(Path(__file__).parents[1] / 'src_py'),
+                *os.environ.get('PYTHONPATH', '').split(os.pathsep)]),
+           'DOIT_NUM_PROCESS': '0'}
+
+    subprocess.run([sys.executable, '-m', 'doit', *args],
+                   cwd=tmp_path,
+                   env=env,
+                   stdout=subprocess.DEVNULL,
+                   check=True)
+
+    assert (tmp_path / 'sigint').read_text() == 'True'
+
+
+def test_watcher_clears_path_rglob_cache(tmp_path):
+    from hat.doit import common
+    from hat.doit.watch import Watcher
+
+    (tmp_path / 'a').touch()
+    assert list(common.path_rglob(tmp_path, cache=True)) == [tmp_path / 'a']
+
+    results = []
+    watcher = Watcher(0.05)
+
+    def on_change(paths):
+        results.append(list(common.path_rglob(tmp_path, cache=True)))
+        watcher.stop()
+
+    watcher.add_handler([tmp_path], on_change)
+
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+
+    try:
+        # watcher could be not yet started
+        start = time.monotonic()
+        while not wait_until(lambda: results, 0.5):
+            (tmp_path / 'b').touch()
+            assert time.monotonic() - start < 10
+
+    finally:
+        watcher.stop()
+        thread.join()
+
+    assert results[0] == [tmp_path / 'a', tmp_path / 'b']